@@ -24,11 +24,25 @@
 # SOFTWARE.
 
 import argparse
+import collections
+import hashlib
+import hmac
+import itertools
+import json
 import logging
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
+from operator import itemgetter
 import os
+import Queue
+import requests
 from requests.exceptions import ConnectionError
+import socket
+import sqlite3
 import sys
+import threading
 import time
+import urllib
 
 from ceilometerclient.v2 import client as ceilometer_client
 import ceilometerclient.exc
@@ -36,6 +50,7 @@ import cinderclient.exceptions
 from cinderclient.v1 import client as cinder_client
 from glanceclient.v2 import client as glance_client
 import glanceclient.exc
+from heatclient.v1 import client as heat_client
 from keystoneclient.apiclient import exceptions as api_exceptions
 from keystoneclient.v2_0 import client as keystone_client
 import keystoneclient.openstack.common.apiclient.exceptions
@@ -43,10 +58,24 @@ import neutronclient.common.exceptions
 from neutronclient.v2_0 import client as neutron_client
 import novaclient.exceptions
 from novaclient.v1_1 import client as nova_client
+import pkg_resources
 from swiftclient import client as swift_client
 
 RETRIES = 10  # Retry a delete operation 10 times before exiting
 TIMEOUT = 5   # 5 seconds timeout between retries
+DELETE_TIMEOUT = 600  # Seconds to wait for asynchronous deletions to complete
+REQUEST_TIMEOUT = 60  # Seconds to wait for a response to a raw API request
+WORKERS = 10  # Number of concurrent deletions, when deleting concurrently
+PAGE_SIZE = 1000  # Resources per listing request, the APIs' default max limit
+CACHE_TTL = 3600  # Seconds during which cached projects names remain valid
+STALE_DURATION = 300  # Seconds before its expiry when a cached token is renewed
+PASSWORD_ITERATIONS = 100000  # PBKDF2 iterations of the cached password verifier
+POLL_INTERVAL = 5  # Seconds between two scans of the spool directory
+LEASE_DURATION = 300  # Seconds a project lease lasts if not renewed
+LEASE_ATTEMPTS = 3  # Number of times a project is leased before giving up
+PROGRESS_INTERVAL = 10  # Seconds between progress reports, when not on a terminal
+RECONCILE_INTERVAL = 86400  # Seconds between full listings of incremental purges
+CLOCK_SKEW = 300  # Seconds subtracted from the last sweep time of incremental purges
 
 # Squelch logging from the libraries we use
 logging.getLogger("requests").setLevel(logging.WARNING)
@@ -59,6 +88,15 @@ class ResourceNotEnabled(Exception):
     pass
 
 
+class ListingStopped(Exception):
+    pass
+
+
+class BaselineMissing(ResourceNotEnabled):
+    """The baseline run didn't list the resources class in the project."""
+    pass
+
+
 class EndpointNotFound(Exception):
     pass
 
@@ -81,9 +119,19 @@ CONNECTION_ERROR_CODE = 5
 NOT_AUTHORIZED = 6
 
 
-# Available resources classes
+class PurgeAborted(Exception):
+    ERROR_CODE = 7
+
 
-RESOURCES_CLASSES = ['CinderSnapshots',
+# Available resources classes, in the order they are purged. Classes
+# registered through the RESOURCES_ENTRY_POINT entry point group and
+# absent from this list are purged afterwards, once the classes they
+# depend on have been purged.
+
+RESOURCES_ENTRY_POINT = 'ospurge.resources'
+
+RESOURCES_CLASSES = ['HeatStacks',
+                     'CinderSnapshots',
                      'CinderBackups',
                      'NovaServers',
                      'NeutronFloatingIps',
@@ -99,30 +147,248 @@ RESOURCES_CLASSES = ['CinderSnapshots',
                      #'CeilometerAlarms',
                      ]
 
+# Resources classes by name, filled by register_resources_class
+RESOURCES_REGISTRY = {}
+
 
 # Decorators
 
-def retry(service_name):
+def register_resources_class(cls):
+    """Decorator making a Resources class available to perform_on_project"""
+    RESOURCES_REGISTRY[cls.__name__] = cls
+    return cls
+
+
+def inventoried(func):
+    """
+    Decorator serving a list() method from the session's AdminInventory,
+    when there is one.
+    """
+    def wrapper(self):
+        if self.session.inventory is not None:
+            return self.session.inventory.list(self)
+        return func(self)
+    return wrapper
+
+
+def retry(service_name, progress=None):
     def factory(func):
-        """Decorator allowing to retry in case of failure"""
+        """
+        Decorator allowing to retry in case of failure. Retries and
+        failures are counted by progress, a Progress, if set.
+        """
         def wrapper(*args, **kwargs):
             n = 0
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except Exception:
-                    if n == RETRIES:
-                        raise DeletionFailed(service_name)
-                    n += 1
-                    logging.info("* Deletion failed - "
-                                 "Retrying in {} seconds - "
-                                 "Retry count {}".format(TIMEOUT, n))
-                    time.sleep(TIMEOUT)
+            try:
+                while True:
+                    try:
+                        return func(*args, **kwargs)
+                    except Exception as exc:
+                        if not_found(exc):
+                            # Already deleted, e.g. along with its parent.
+                            # Deletions making several calls only let the
+                            # last one report it (see ignore_not_found).
+                            logging.info("* Resource already deleted")
+                            return None
+                        if n == RETRIES:
+                            if progress is not None:
+                                progress.add(service_name, 'failed')
+                            raise DeletionFailed(service_name)
+                        if n == 0 and progress is not None:
+                            progress.add(service_name, 'retrying')
+                        n += 1
+                        logging.info("* Deletion failed - "
+                                     "Retrying in {} seconds - "
+                                     "Retry count {}".format(TIMEOUT, n))
+                        time.sleep(TIMEOUT)
+            finally:
+                if n and progress is not None:
+                    progress.add(service_name, 'retrying', -1)
         return wrapper
     return factory
 
 
+def not_found(exc):
+    """
+    Whether exc, raised by any of the client libraries, reports that
+    the resource doesn't exist.
+    """
+    response = getattr(exc, 'response', None)
+    codes = (getattr(exc, 'code', None), getattr(exc, 'status_code', None),
+             getattr(exc, 'http_status', None),
+             getattr(response, 'status_code', None))
+    return 404 in codes
+
+
+def ignore_not_found(func, *args, **kwargs):
+    """
+    Calls func, a step of a deletion preceding the final delete call,
+    ignoring a 404: only the final call tells whether the resource is
+    already deleted, retry() taking its 404 for a completed deletion.
+    """
+    try:
+        return func(*args, **kwargs)
+    except Exception as exc:
+        if not not_found(exc):
+            raise
+        logging.info("* Not found, deleting anyway")
+        return None
+
+
+def parallel(func, iterable, workers=WORKERS):
+    """
+    Calls func on each element of iterable from a pool of workers
+    threads. iterable is consumed while func runs. Returns the results
+    in order, or raises the first exception raised by func.
+    """
+    pool = ThreadPool(workers)
+    try:
+        return list(pool.imap(func, iterable))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def absolute_limit(limits, name):
+    """
+    Returns the value of the named absolute limit of a Nova or Cinder
+    Limits object, None if the API doesn't report it.
+    """
+    for limit in limits.absolute:
+        if limit.name == name:
+            return limit.value
+    return None
+
+
+def load_cache(path, ttl=None):
+    """
+    Returns the data stored in the JSON cache file at path, or None if
+    there is none or if it is older than ttl seconds.
+    """
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path) as cache:
+            return json.load(cache)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_cache(path, data):
+    """
+    Stores data in the JSON cache file at path, readable by its owner
+    only. Failing to do so is not an error.
+    """
+    tmp_path = "{}.{}".format(path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as cache:
+            json.dump(data, cache)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as exc:
+        logging.warning("Unable to write cache {}: {}".format(path, exc))
+
+
+def paginate(list_page, page_size, get_marker=attrgetter('id')):
+    """
+    Returns a generator over the resources of a marker/limit paginated
+    listing. list_page(marker, limit) returns the page of resources
+    following the one identified by marker (the first page if marker is
+    None), or all of them if limit is None. An empty page ends the
+    listing: APIs cap the pages size (e.g. Nova's osapi_max_limit), so a
+    page shorter than page_size isn't necessarily the last one.
+    The first page is fetched right away, so that listing errors are
+    raised by the caller. The next page is fetched before the last
+    resource of the current page is yielded, so that resources can be
+    deleted while they are listed without invalidating the marker.
+    """
+    def resources(page):
+        while page:
+            for resource in page[:-1]:
+                yield resource
+            last = page[-1]
+            next_page = list_page(get_marker(last), page_size)
+            markers = set(get_marker(res) for res in page)
+            if next_page and get_marker(next_page[0]) in markers:
+                # APIs without pagination support ignore the marker
+                logging.warning("Listing marker ignored, listing all "
+                                "resources at once")
+                yield last
+                for resource in list_page(None, None):
+                    if get_marker(resource) not in markers:
+                        yield resource
+                return
+            yield last
+            page = next_page
+    return resources(list_page(None, page_size))
+
+
 # Classes
+class AuthCache(object):
+
+    """
+    On-disk cache of a Keystone authentication (scoped token and service
+    catalog), along with data that remains valid as long as the token.
+    The cache file is named after the credentials, except the password
+    which could otherwise be brute-forced from the name. The file holds
+    a salted PBKDF2 hash of the password instead, so that the cached
+    token is only used with the password it was obtained with.
+    """
+
+    def __init__(self, cache_dir, **credentials):
+        identity = dict((key, value) for key, value in credentials.items()
+                        if key != 'password')
+        key = hashlib.sha256(json.dumps(identity, sort_keys=True))
+        self.path = os.path.join(cache_dir,
+                                 "auth-{}.json".format(key.hexdigest()))
+        self.credentials = credentials
+        self.data = {}
+
+    def client(self):
+        """
+        Returns a Keystone client, authenticating only if the cached
+        token is missing or about to expire.
+        """
+        cache = load_cache(self.path)
+        if cache and self.verify(cache.get('verifier')):
+            client = keystone_client.Client(auth_ref=cache['auth_ref'],
+                                            **self.credentials)
+            if not client.auth_ref.will_expire_soon(STALE_DURATION):
+                self.data = cache
+                return client
+        client = keystone_client.Client(**self.credentials)
+        salt = os.urandom(16).encode('hex')
+        self.data = {'auth_ref': dict(client.auth_ref),
+                     'verifier': {'salt': salt, 'hash': self.hash(salt)}}
+        save_cache(self.path, self.data)
+        return client
+
+    def hash(self, salt):
+        password = self.credentials.get('password') or ''
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        return hashlib.pbkdf2_hmac('sha256', password, salt.encode('ascii'),
+                                   PASSWORD_ITERATIONS).encode('hex')
+
+    def verify(self, verifier):
+        """Whether verifier, from the cache, matches the password."""
+        if not verifier:
+            return False
+        return hmac.compare_digest(str(self.hash(verifier['salt'])),
+                                   str(verifier['hash']))
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+        save_cache(self.path, self.data)
+
+
 class Session(object):
 
     """
@@ -133,10 +399,19 @@ class Session(object):
     """
 
     def __init__(self, username, password, project_id, auth_url,
-                 endpoint_type="publicURL", region_name=None, insecure=False):
-        client = keystone_client.Client(
+                 endpoint_type="publicURL", region_name=None, insecure=False,
+                 inventory=None, detailed=False, page_size=PAGE_SIZE,
+                 workers=WORKERS, resources=None, cache_dir=None,
+                 store=None, baseline=None, incremental=False,
+                 reconcile_interval=RECONCILE_INTERVAL, force_delete=False,
+                 progress=None):
+        credentials = dict(
             username=username, password=password, tenant_id=project_id,
             auth_url=auth_url, region_name=region_name, insecure=insecure)
+        if cache_dir:
+            client = AuthCache(cache_dir, **credentials).client()
+        else:
+            client = keystone_client.Client(**credentials)
         # Storing username, password, project_id and auth_url for
         # use by clients libraries that cannot use an existing token.
         self.username = username
@@ -151,6 +426,44 @@ class Session(object):
         self.project_name = client.project_name
         self.endpoint_type = endpoint_type
         self.catalog = client.service_catalog.get_endpoints()
+        # AdminInventory shared by the projects of a batch, if any
+        self.inventory = inventory
+        # Whether to list resources with all their attributes, or only
+        # with those required to display and delete them
+        self.detailed = detailed
+        self.page_size = page_size
+        self.workers = workers
+        # Names of the resources classes acted on, None for all
+        self.resources = resources
+        # InventoryStore recording the listings, and run of the store
+        # listings are compared with
+        self.store = store
+        self.baseline = baseline
+        # Whether to only list the resources created since the last
+        # purge of their class recorded in store, and how often to list
+        # them all anyway
+        self.incremental = incremental
+        self.reconcile_interval = reconcile_interval
+        # Whether to force the deletion of soft deleted servers
+        self.force_delete = force_delete
+        # Resources listed by a class on behalf of another, by class
+        self.listed = {}
+        # Progress counting the listed and deleted resources, if any
+        self.progress = progress
+        # Clients shared by the resources classes, by service type
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+
+    def client(self, service_type, build):
+        """
+        Returns the client of service_type shared by the resources
+        classes of the session, built by build() when first requested:
+        clients authenticating by themselves do so once per session.
+        """
+        with self.clients_lock:
+            if service_type not in self.clients:
+                self.clients[service_type] = build()
+            return self.clients[service_type]
 
     def get_endpoint(self, service_type):
         try:
@@ -159,230 +472,946 @@ class Session(object):
             # Endpoint could not be found
             raise EndpointNotFound(service_type)
 
+    def has_service(self, service_type):
+        try:
+            self.get_endpoint(service_type)
+        except EndpointNotFound:
+            return False
+        return True
+
+    def acts_on(self, resources_class_name):
+        if self.resources is None:
+            return True
+        return resources_class_name in self.resources
+
+
+class ResourceRef(object):
+
+    """
+    Compact reference to a resource, holding only what is needed to
+    display and delete it. details holds all the resource's attributes
+    when resources are listed in detail, None otherwise.
+    """
+
+    __slots__ = ('type', 'id', 'name', 'parent', 'owner', 'details')
+
+    def __init__(self, type, id, name, parent=None, owner=None, details=None):
+        self.type = type
+        self.id = id
+        self.name = name
+        # Container of a Swift object, router of an interface...
+        self.parent = parent
+        self.owner = owner
+        self.details = details
+
+    def __repr__(self):
+        return "<ResourceRef {} {}>".format(self.type, self.id)
+
 
 class Resources(object):
 
     """
     Abstract base class for all resources to be removed.
+
+    Subclasses set SERVICE_TYPE to the catalog service type they rely
+    on, and DEPENDS_ON to the names of the resources classes that must
+    be purged before them. list() yields ResourceRef objects of type
+    RESOURCE_TYPE, which delete() and resource_str() take. Classes
+    setting LISTS_ALL_TENANTS implement list_all_tenants(), listing the
+    resources of all projects visible to the session with their owner
+    set, which AdminInventory and sweep_orphans rely on.
     """
 
+    SERVICE_TYPE = None
+    DEPENDS_ON = ()
+    RESOURCE_TYPE = None
+    LISTS_ALL_TENANTS = False
+
     def __init__(self, session):
         self.session = session
+        # When set, list() may only return the resources created or
+        # updated since then (an ISO 8601 UTC time without timezone)
+        self.since = None
 
     def list(self):
         pass
 
+    def owner(self, resource):
+        """Returns the ID of the project owning resource."""
+        return resource.owner
+
+    def reference(self, resource_id, name, parent=None, owner=None, raw=None):
+        """
+        Returns a ResourceRef to a resource of this class. raw is the
+        resource as returned by the client library, whose attributes are
+        kept only when the session lists detailed resources.
+        """
+        details = None
+        if self.session.detailed and raw is not None:
+            if isinstance(raw, dict):
+                details = raw
+            else:
+                details = getattr(raw, '_info', None)
+        return ResourceRef(self.RESOURCE_TYPE, resource_id, name, parent,
+                           owner, details)
+
+    def resource_str(self, resource):
+        return "{} {} (id {})".format(resource.type, resource.name,
+                                      resource.id)
+
+    def resource_details(self, resource):
+        """Returns the attributes of resource as a dict."""
+        return resource.details or {}
+
     def delete(self, resource):
         """
         Displays informational message about a resource deletion.
         """
         logging.info("* Deleting {}.".format(self.resource_str(resource)))
 
+    def listing(self):
+        """
+        Returns self.list(), recorded in the session's InventoryStore if
+        there is one, and restricted to the resources changed since the
+        last sweep when the session is incremental.
+        """
+        self.since = self.sweep_since()
+        resources = self.list()
+        if self.session.store is not None:
+            resources = self.session.store.record(self, resources)
+        return resources
+
+    def baseline_keys(self):
+        """
+        Returns the (parent, id) keys of the resources listed by the
+        session's baseline run, None if there is no baseline. Raises
+        BaselineMissing if the baseline run didn't list them all (e.g.
+        it was a --summary run, or one of another project), rather than
+        taking every resource for a new one.
+        """
+        session = self.session
+        if session.baseline is None:
+            return None
+        c_name = self.__class__.__name__
+        if not session.store.listed(session.baseline, session.project_id,
+                                    c_name):
+            logging.warning(
+                "Run {} has no listing of {} in project {}, skipping "
+                "them".format(session.baseline, c_name, session.project_id))
+            raise BaselineMissing(c_name)
+        return session.store.keys(session.baseline, session.project_id,
+                                  c_name)
+
+    def sweep_since(self):
+        """
+        Returns the time since when resources are listed by an
+        incremental session, None if they must all be listed.
+        """
+        session = self.session
+        if not session.incremental or session.inventory is not None:
+            return None
+        sweep = session.store.last_sweep(session.project_id,
+                                         self.__class__.__name__)
+        if sweep is None:
+            return None
+        swept, reconciled = sweep
+        if time.time() - reconciled >= session.reconcile_interval:
+            return None
+        return time.strftime('%Y-%m-%dT%H:%M:%S',
+                             time.gmtime(swept - CLOCK_SKEW))
+
     def purge(self):
-        "Delete all resources."
+        "Delete all resources, or those new since the baseline run."
+        started = time.time()
+        baseline = self.baseline_keys()
         # Purging is displayed and done only if self.list succeeds
-        resources = self.list()
+        resources = self.listing()
+        if baseline is not None:
+            resources = (res for res in resources
+                         if InventoryStore.key(res) not in baseline)
         c_name = self.__class__.__name__
+        if self.session.progress is not None:
+            resources = self.counted(resources, baseline)
         logging.info("* Purging {}".format(c_name))
-        for resource in resources:
-            retry(c_name)(self.delete)(resource)
+        self.delete_resources(resources)
+        if self.session.incremental:
+            # Next purges only list what was created since this one
+            self.session.store.record_sweep(self.session.project_id, c_name,
+                                            started, full=self.since is None)
+
+    def counted(self, resources, baseline):
+        """
+        Counts resources as listed by the session's Progress upfront, so
+        that the remaining time is estimated from the first deletions:
+        from the service's aggregate count when all the resources are to
+        be deleted, by listing them before deleting them otherwise.
+        """
+        c_name = self.__class__.__name__
+        progress = self.session.progress
+        if baseline is None and self.since is None:
+            count = self.aggregate_count()
+            if count is not None:
+                progress.add(c_name, 'listed', count)
+                progress.listing_done(c_name)
+                return resources
+        return list(progress.counted(c_name, resources))
+
+    def deleter(self, delete=None):
+        """
+        Returns a function deleting a resource with delete (self.delete
+        by default), retried in case of failure. Deletions are counted
+        by the session's Progress if any.
+        """
+        c_name = self.__class__.__name__
+        progress = self.session.progress
+        retried_delete = retry(c_name, progress)(delete or self.delete)
+
+        def delete_resource(resource):
+            retried_delete(resource)
+            if progress is not None:
+                progress.add(c_name, 'deleted')
+        return delete_resource
+
+    def delete_resources(self, resources, workers=1):
+        "Delete resources, from workers threads if workers > 1."
+        delete = self.deleter()
+        if workers > 1:
+            parallel(delete, resources, workers)
+        else:
+            for resource in resources:
+                delete(resource)
+
+    def wait_deleted(self, resources, statuses, failed=(), delete=None):
+        """
+        Waits until the asynchronous deletions of resources complete,
+        calling statuses() every TIMEOUT seconds. statuses returns the
+        statuses of the listed resources by ID, so that a single listing
+        reports on all the pending deletions. Resources whose status is
+        in failed are deleted again with delete (self.delete by default),
+        retried in case of failure, up to RETRIES times. Raises
+        DeletionFailed if resources are still listed after DELETE_TIMEOUT
+        seconds.
+        """
+        c_name = self.__class__.__name__
+        delete = retry(c_name, self.session.progress)(delete or self.delete)
+        pending = dict((res.id, res) for res in resources)
+        attempts = collections.Counter()
+        deadline = time.time() + DELETE_TIMEOUT
+        while pending:
+            listed = statuses()
+            for res_id, res in list(pending.items()):
+                status = listed.get(res_id)
+                if status is None:
+                    del pending[res_id]
+                elif status in failed:
+                    if attempts[res_id] == RETRIES:
+                        raise DeletionFailed(c_name)
+                    attempts[res_id] += 1
+                    delete(res)
+            if not pending:
+                break
+            if time.time() >= deadline:
+                raise DeletionFailed(c_name)
+            logging.info("* Waiting for the deletion of {} {}".format(
+                len(pending), c_name))
+            time.sleep(TIMEOUT)
+
+    def count(self):
+        """
+        Returns the number of resources, from an aggregate count when
+        the service provides one, by listing them otherwise.
+        """
+        count = self.aggregate_count()
+        if count is None:
+            count = sum(1 for _ in self.list())
+        return count
+
+    def aggregate_count(self):
+        "Returns the number of resources counted by the service, if any."
+        return None
+
+    def summary(self):
+        "Display the number of available resources."
+        print(self.summary_str())
+
+    def summary_str(self):
+        return "* {}: {}".format(self.__class__.__name__, self.count())
 
     def dump(self):
         "Display all available resources."
+        for line in self.dump_lines():
+            print(line)
+
+    def dump_lines(self):
+        "Yields the lines displayed by dump(), as resources are listed."
+        # Resources new since the baseline run are prefixed with +, and
+        # the ones removed since then are displayed with a - prefix
+        baseline = self.baseline_keys()
         # Resources type and resources are displayed only if self.list succeeds
-        resources = self.list()
+        resources = self.listing()
         c_name = self.__class__.__name__
-        print("* Resources type: {}".format(c_name))
+        yield "* Resources type: {}".format(c_name)
+        listed = set()
         for resource in resources:
-            print(self.resource_str(resource))
-        print("")
+            line = self.resource_str(resource)
+            if baseline is not None:
+                listed.add(InventoryStore.key(resource))
+                new = InventoryStore.key(resource) not in baseline
+                line = "{} {}".format("+" if new else " ", line)
+            yield line
+            if self.session.detailed:
+                details = self.resource_details(resource)
+                for key in sorted(details):
+                    yield "    {}: {}".format(key, details[key])
+        if baseline is not None:
+            removed = [ref for ref in self.session.store.references(
+                self.session.baseline, self.session.project_id, c_name)
+                if InventoryStore.key(ref) not in listed]
+            for ref in removed:
+                yield "- {}".format(self.resource_str(ref))
+            yield "* Since run {}: {} new, {} removed, {} unchanged".format(
+                self.session.baseline, len(listed - baseline), len(removed),
+                len(listed & baseline))
+        yield ""
 
 
 class SwiftResources(Resources):
 
+    SERVICE_TYPE = 'object-store'
+
     def __init__(self, session):
         super(SwiftResources, self).__init__(session)
         self.endpoint = self.session.get_endpoint("object-store")
         self.token = self.session.token
-        conn = swift_client.HTTPConnection(self.endpoint, insecure=self.session.insecure)
-        self.http_conn = conn.parsed_url, conn
+        self.local = threading.local()
+
+    @property
+    def http_conn(self):
+        # Swift connections can't be shared between threads
+        if not hasattr(self.local, 'http_conn'):
+            conn = swift_client.HTTPConnection(self.endpoint, insecure=self.session.insecure)
+            self.local.http_conn = conn.parsed_url, conn
+        return self.local.http_conn
 
     # This method is used to retrieve Objects as well as Containers.
     def list_containers(self):
-        containers = swift_client.get_account(self.endpoint, self.token, http_conn=self.http_conn)[1]
+        def list_page(marker, limit):
+            return swift_client.get_account(
+                self.endpoint, self.token, marker=marker, limit=limit,
+                http_conn=self.http_conn)[1]
+        containers = paginate(list_page, self.session.page_size,
+                              itemgetter('name'))
         return (cont['name'] for cont in containers)
 
+    def list_objects(self, container):
+        def list_page(marker, limit):
+            return swift_client.get_container(
+                self.endpoint, self.token, container, marker=marker,
+                limit=limit, http_conn=self.http_conn)[1]
+        return paginate(list_page, self.session.page_size, itemgetter('name'))
 
+    def head_account(self):
+        return swift_client.head_account(self.endpoint, self.token,
+                                         http_conn=self.http_conn)
+
+    def delete_container(self, container):
+        swift_client.delete_container(self.endpoint, self.token, container, http_conn=self.http_conn)
+
+
+@register_resources_class
 class SwiftObjects(SwiftResources):
 
+    """
+    Static large objects are deleted along with their segments in a
+    single request, and their segments are then skipped when their
+    container (usually another one, e.g. <container>_segments) is
+    purged afterwards. Segments listed before their manifest was
+    deleted get deleted again, which Swift reports as not found.
+    Dynamic large objects manifests and segments are plain objects to
+    Swift, and are deleted as such.
+    """
+
+    RESOURCE_TYPE = 'object'
+    SLO_TYPE = 'static large object'
+
+    def __init__(self, session):
+        super(SwiftObjects, self).__init__(session)
+        # Names of the segments deleted with their manifest by container,
+        # until their container is purged
+        self.deleted_segments = {}
+        self.purged_containers = set()
+        self.segments_lock = threading.Lock()
+
     def list(self):
-        swift_objects = []
-        for cont in self.list_containers():
-            objs = [{'container': cont, 'name': obj['name']} for obj in
-                    swift_client.get_container(self.endpoint, self.token, cont, http_conn=self.http_conn)[1]]
-            swift_objects.extend(objs)
-        return swift_objects
+        return (obj for cont in self.list_containers()
+                for obj in self.list_container(cont))
+
+    def list_container(self, container):
+        return (self.reference_object(container, obj)
+                for obj in self.list_objects(container))
+
+    def reference_object(self, container, obj):
+        ref = self.reference(obj['name'], obj['name'], container, raw=obj)
+        # Listings flag SLO manifests since Swift 2.21. Older ones are
+        # deleted as plain objects, and so are their segments.
+        if 'slo_etag' in obj:
+            ref.type = self.SLO_TYPE
+        return ref
+
+    def purge(self):
+        """
+        Delete all objects, the containers being purged concurrently
+        from a pool of workers, while their objects are deleted from
+        another pool of workers shared by all containers. A container
+        queues at most a page of deletions at a time, so that a large
+        container doesn't hold up the others. When SwiftContainers are
+        purged as well, each container is deleted as soon as it is
+        empty, and the containers left are handed over to
+        SwiftContainers, which doesn't list them again.
+        """
+        baseline = self.baseline_keys()
+        containers = self.list_containers()
+        c_name = self.__class__.__name__
+        progress = self.session.progress
+        if progress is not None and baseline is None:
+            # The account tells the number of objects to delete upfront
+            progress.add(c_name, 'listed', self.count())
+            progress.listing_done(c_name)
+        logging.info("* Purging {}".format(c_name))
+        workers = self.session.workers
+        pool = ThreadPool(workers)
+        containers_pool = ThreadPool(workers)
+        # Containers are listed here, and purged once a worker is free
+        free = threading.BoundedSemaphore(workers)
+
+        def purge_container(container):
+            try:
+                return container, self.purge_container(container, pool,
+                                                       baseline)
+            finally:
+                free.release()
+        remaining = []
+        pending = []
+
+        def collect(results):
+            # Returns the results not ready, raising the first error
+            for result in results:
+                if not result.ready():
+                    yield result
+                    continue
+                container, deleted = result.get()
+                if not deleted:
+                    remaining.append(container)
+        try:
+            for container in containers:
+                free.acquire()
+                pending = list(collect(pending))
+                pending.append(containers_pool.apply_async(
+                    purge_container, (container,)))
+            for result in pending:
+                result.wait()
+            list(collect(pending))
+        finally:
+            containers_pool.close()
+            containers_pool.join()
+            pool.close()
+            pool.join()
+        self.deleted_segments.clear()
+        self.purged_containers.clear()
+        if progress is not None:
+            progress.listing_done(c_name)
+        if self.session.acts_on('SwiftContainers'):
+            self.session.listed['SwiftContainers'] = remaining
+
+    def purge_container(self, container, pool, baseline=None):
+        """
+        Deletes the objects of container from pool, or those new since
+        the baseline run if baseline holds the keys of the objects it
+        listed. Returns whether container was deleted as well.
+        """
+        objs = self.list_container(container)
+        if self.session.store is not None:
+            objs = self.session.store.record(self, objs)
+        c_name = self.__class__.__name__
+        progress = self.session.progress
+        # Objects aren't recorded in the session, there may be millions
+        retried_delete = retry(c_name, progress)(self.delete)
+
+        def delete(obj):
+            retried_delete(obj)
+            if progress is not None:
+                progress.add(c_name, 'deleted')
+        # Deletions queued in the pool, at most a page of them
+        pending = collections.deque()
+        count = 0
+        for obj in objs:
+            if baseline is not None:
+                if InventoryStore.key(obj) in baseline:
+                    continue
+                # Objects new since the baseline are counted as listed
+                if progress is not None:
+                    progress.add(c_name, 'listed')
+            pending.append(pool.apply_async(delete, (obj,)))
+            count += 1
+            if len(pending) >= self.session.page_size:
+                pending.popleft().get()
+            if count % self.session.page_size == 0:
+                logging.info("* Deleted {} objects of container {}".format(
+                    count - len(pending), container))
+        while pending:
+            pending.popleft().get()
+        with self.segments_lock:
+            # Segments deleted from now on won't be listed again
+            self.deleted_segments.pop(container, None)
+            self.purged_containers.add(container)
+        logging.info("* Deleted {} objects of container {}".format(
+            count, container))
+        # Containers new since the baseline are left to SwiftContainers
+        if not self.session.acts_on('SwiftContainers') or baseline is not None:
+            return False
+        logging.info("* Deleting container {}.".format(container))
+        retry('SwiftContainers')(self.delete_container)(container)
+        return True
 
     def delete(self, obj):
+        if obj.name in self.deleted_segments.get(obj.parent, ()):
+            return
         super(SwiftObjects, self).delete(obj)
-        swift_client.delete_object(self.endpoint, token=self.token, http_conn=self.http_conn,
-                                   container=obj['container'], name=obj['name'])
+        query_string = None
+        segments = ()
+        if obj.type == self.SLO_TYPE:
+            segments = self.list_segments(obj)
+            query_string = 'multipart-manifest=delete'
+        try:
+            swift_client.delete_object(self.endpoint, token=self.token, http_conn=self.http_conn,
+                                       container=obj.parent, name=obj.name,
+                                       query_string=query_string)
+        except swift_client.ClientException as exc:
+            # Segment deleted with its manifest by another thread
+            if exc.http_status != 404:
+                raise
+            return
+        # Segments are skipped only once they are known to be deleted
+        with self.segments_lock:
+            for container, name in segments:
+                if container not in self.purged_containers:
+                    self.deleted_segments.setdefault(container,
+                                                     set()).add(name)
+
+    def list_segments(self, manifest):
+        """Returns the (container, name) of the segments of a SLO."""
+        segments = swift_client.get_object(
+            self.endpoint, self.token, manifest.parent, manifest.name,
+            query_string='multipart-manifest=get',
+            http_conn=self.http_conn)[1]
+        return [tuple(seg['name'].lstrip('/').split('/', 1))
+                for seg in json.loads(segments)]
 
     def resource_str(self, obj):
-        return "object {} in container {}".format(obj['name'], obj['container'])
+        return "{} {} in container {}".format(obj.type, obj.name, obj.parent)
+
+    def count(self):
+        return int(self.head_account()['x-account-object-count'])
 
+    def summary_str(self):
+        headers = self.head_account()
+        return "* {}: {} ({} bytes)".format(
+            self.__class__.__name__, headers['x-account-object-count'],
+            headers['x-account-bytes-used'])
 
+
+@register_resources_class
 class SwiftContainers(SwiftResources):
 
+    DEPENDS_ON = ('SwiftObjects',)
+    RESOURCE_TYPE = 'container'
+
     def list(self):
-        return self.list_containers()
+        # Containers left by the purge of SwiftObjects, if it listed them
+        containers = self.session.listed.pop(self.__class__.__name__, None)
+        if containers is None:
+            containers = self.list_containers()
+        return (self.reference(cont, cont) for cont in containers)
 
     def delete(self, container):
         """Container must be empty for deletion to succeed."""
         super(SwiftContainers, self).delete(container)
-        swift_client.delete_container(self.endpoint, self.token, container, http_conn=self.http_conn)
+        self.delete_container(container.name)
 
     def resource_str(self, obj):
-        return "container {}".format(obj)
+        return "container {}".format(obj.name)
+
+    def count(self):
+        return int(self.head_account()['x-account-container-count'])
 
 
 class CinderResources(Resources):
 
+    SERVICE_TYPE = 'volume'
+    # Absolute limit holding the number of resources used by the project
+    LIMIT_USED = None
+
     def __init__(self, session):
         super(CinderResources, self).__init__(session)
+
         # Cinder client library can't use an existing token. When
-        # using this library, we have to reauthenticate.
-        self.client = cinder_client.Client(
-            session.username, session.password,
-            session.project_name, session.auth_url, session.insecure,
-            endpoint_type=session.endpoint_type,
-            region_name=session.region_name)
+        # using this library, we have to reauthenticate, once per session.
+        def build():
+            return cinder_client.Client(
+                session.username, session.password,
+                session.project_name, session.auth_url, session.insecure,
+                endpoint_type=session.endpoint_type,
+                region_name=session.region_name)
+        self.client = session.client(self.SERVICE_TYPE, build)
+
+    def list_paginated(self, manager, detailed, **search_opts):
+        def list_page(marker, limit):
+            return manager.list(detailed=detailed, search_opts=dict(
+                search_opts, marker=marker, limit=limit))
+        return paginate(list_page, self.session.page_size)
+
+    def cascades(self):
+        """
+        Whether the project's snapshots are deleted along with their
+        volumes, which the v3 API supports. This doesn't hold when some
+        volumes are kept (see the baseline and incremental sessions), or
+        when snapshots are (e.g. with --exclude-resources CinderSnapshots).
+        """
+        session = self.session
+        if session.baseline is not None or session.incremental:
+            return False
+        if not session.acts_on('CinderVolumes'):
+            return False
+        if not session.acts_on('CinderSnapshots'):
+            return False
+        return session.has_service('volumev3')
+
+    def aggregate_count(self):
+        return absolute_limit(self.client.limits.get(), self.LIMIT_USED)
 
 
+@register_resources_class
 class CinderSnapshots(CinderResources):
 
+    RESOURCE_TYPE = 'snapshot'
+    LISTS_ALL_TENANTS = True
+    LIMIT_USED = 'totalSnapshotsUsed'
+
+    @inventoried
     def list(self):
-        return self.client.volume_snapshots.list()
+        return (self.reference(snap.id, snap.display_name, raw=snap)
+                for snap in self.list_paginated(self.client.volume_snapshots,
+                                                self.session.detailed))
+
+    def list_all_tenants(self):
+        return (self.reference(
+            snap.id, snap.display_name, raw=snap,
+            owner=getattr(snap, 'os-extended-snapshot-attributes:project_id'))
+            for snap in self.list_paginated(self.client.volume_snapshots,
+                                            True, all_tenants=1))
+
+    def purge(self):
+        if self.cascades():
+            logging.info("* Skipping CinderSnapshots: deleted with their "
+                         "volumes by CinderVolumes")
+            return
+        super(CinderSnapshots, self).purge()
 
     def delete(self, snap):
         super(CinderSnapshots, self).delete(snap)
-        self.client.volume_snapshots.delete(snap)
-
-    def resource_str(self, snap):
-        return "snapshot {} (id {})".format(snap.display_name, snap.id)
+        self.client.volume_snapshots.delete(snap.id)
 
 
+@register_resources_class
 class CinderVolumes(CinderResources):
 
+    DEPENDS_ON = ('CinderSnapshots', 'NovaServers')
+    RESOURCE_TYPE = 'volume'
+    LISTS_ALL_TENANTS = True
+    LIMIT_USED = 'totalVolumesUsed'
+
+    @inventoried
     def list(self):
-        return self.client.volumes.list()
+        if self.since is None:
+            volumes = self.list_paginated(self.client.volumes,
+                                          self.session.detailed)
+        else:
+            # Volumes are listed from the most recently created one:
+            # the listing stops at the first volume created before since
+            volumes = itertools.takewhile(
+                lambda vol: vol.created_at >= self.since,
+                self.list_paginated(self.client.volumes, True))
+        return (self.reference(vol.id, vol.display_name, raw=vol)
+                for vol in volumes)
+
+    def list_all_tenants(self):
+        return (self.reference(vol.id, vol.display_name, raw=vol,
+                               owner=getattr(vol, 'os-vol-tenant-attr:tenant_id'))
+                for vol in self.list_paginated(self.client.volumes, True,
+                                               all_tenants=1))
 
     def delete(self, vol):
-        """Snapshots created from the volume must be deleted first"""
+        """
+        Snapshots created from the volume must be deleted first, unless
+        the v3 API deletes them along with the volume (see cascades()).
+        """
         super(CinderVolumes, self).delete(vol)
-        self.client.volumes.delete(vol)
-
-    def resource_str(self, vol):
-        return "volume {} (id {})".format(vol.display_name, vol.id)
-
-
+        if not self.cascades():
+            self.client.volumes.delete(vol.id)
+            return
+        # The v1 client library doesn't know about cascade deletion
+        response = requests.delete(
+            "{}/volumes/{}".format(self.session.get_endpoint('volumev3'),
+                                   vol.id),
+            params={'cascade': 'true'},
+            headers={'X-Auth-Token': self.session.token},
+            verify=not self.session.insecure, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+
+@register_resources_class
 class CinderBackups(CinderResources):
 
+    RESOURCE_TYPE = 'backup'
+    LIMIT_USED = 'totalBackupsUsed'
+
     def list(self):
-        return self.client.backups.list()
+        # The backups manager doesn't take search options
+        def list_page(marker, limit):
+            params = dict((key, value) for key, value in
+                          (('limit', limit), ('marker', marker)) if value)
+            if not params:
+                return self.client.backups.list()
+            return self.client.backups._list(
+                "/backups/detail?%s" % urllib.urlencode(params), "backups")
+        return (self.reference(backup.id, backup.name, backup.volume_id,
+                               raw=backup)
+                for backup in paginate(list_page, self.session.page_size))
 
     def delete(self, backup):
         super(CinderBackups, self).delete(backup)
-        self.client.backups.delete(backup)
+        self.client.backups.delete(backup.id)
 
     def resource_str(self, backup):
-        return "backup {} (id {}) of volume {}".format(backup.name, backup.id, backup.volume_id)
+        return "backup {} (id {}) of volume {}".format(backup.name, backup.id, backup.parent)
 
 
 class NeutronResources(Resources):
 
+    SERVICE_TYPE = 'network'
+
     def __init__(self, session):
         super(NeutronResources, self).__init__(session)
-        self.client = neutron_client.Client(
-            username=session.username, password=session.password,
-            tenant_id=session.project_id, auth_url=session.auth_url,
-            endpoint_type=session.endpoint_type,
-            region_name=session.region_name, insecure=session.insecure)
+
+        def build():
+            return neutron_client.Client(
+                username=session.username, password=session.password,
+                tenant_id=session.project_id, auth_url=session.auth_url,
+                endpoint_type=session.endpoint_type,
+                region_name=session.region_name, insecure=session.insecure)
+        self.client = session.client(self.SERVICE_TYPE, build)
         self.project_id = session.project_id
 
     # This method is used for routers and interfaces removal
     def list_routers(self):
-        return filter(self._owned_resource, self.client.list_routers()['routers'])
+        return self.owned(self.references(self.list_collection(
+            'routers', ['id', 'name', 'tenant_id'])))
+
+    def list_collection(self, collection, fields, **filters):
+        """
+        Lists a Neutron collection (e.g. 'ports') page by page, asking
+        for the given fields only unless the session lists detailed
+        resources.
+        """
+        if not self.session.detailed:
+            filters['fields'] = fields
+        if self.since is not None:
+            # Ignored by Neutron servers without the timestamp extension
+            filters['changed_since'] = self.since + 'Z'
+        return self.paginated(collection, **filters)
+
+    def paginated(self, collection, **filters):
+        "Lists a Neutron collection page by page, with the given filters."
+        list_pages = getattr(self.client, 'list_' + collection)
+
+        def list_page(marker, limit):
+            params = dict(filters)
+            if limit:
+                params['limit'] = limit
+            if marker:
+                params['marker'] = marker
+            return next(list_pages(retrieve_all=False, **params))[collection]
+        return paginate(list_page, self.session.page_size, itemgetter('id'))
+
+    def references(self, resources, name='name', parent=None):
+        """
+        Returns references to Neutron resources, named after their name
+        attribute, and whose parent is their parent attribute, if any.
+        """
+        return (self.reference(res['id'], res[name],
+                               res[parent] if parent else None,
+                               res['tenant_id'], res)
+                for res in resources)
+
+    def owned(self, resources):
+        return (res for res in resources if self._owned_resource(res))
 
     def _owned_resource(self, res):
         # Only considering resources owned by project
-        return res['tenant_id'] == self.project_id
+        return self.owner(res) == self.project_id
 
 
+@register_resources_class
 class NeutronRouters(NeutronResources):
 
+    DEPENDS_ON = ('NeutronInterfaces',)
+    RESOURCE_TYPE = 'router'
+    LISTS_ALL_TENANTS = True
+
+    @inventoried
     def list(self):
         return self.list_routers()
 
+    def list_all_tenants(self):
+        return self.references(self.list_collection(
+            'routers', ['id', 'name', 'tenant_id']))
+
+    def delete_resources(self, resources, workers=1):
+        "Routers are deleted concurrently."
+        super(NeutronRouters, self).delete_resources(resources,
+                                                     self.session.workers)
+
     def delete(self, router):
         """interfaces must be deleted first"""
         super(NeutronRouters, self).delete(router)
         # Remove router gateway prior to remove the router itself
-        self.client.remove_gateway_router(router['id'])
-        self.client.delete_router(router['id'])
-
-    def resource_str(self, router):
-        return "router {} (id {})".format(router['name'], router['id'])
+        ignore_not_found(self.client.remove_gateway_router, router.id)
+        self.client.delete_router(router.id)
 
 
+@register_resources_class
 class NeutronInterfaces(NeutronResources):
 
+    DEPENDS_ON = ('NeutronFloatingIps',)
+    RESOURCE_TYPE = 'interface'
+    LISTS_ALL_TENANTS = True
+
+    @inventoried
     def list(self):
+        return self.owned(self.list_all_tenants())
+
+    def list_all_tenants(self):
         # Only considering "router_interface" ports
         # (not gateways, neither unbound ports)
-        all_ports = [port for port in self.client.list_ports()['ports']
-                     if port["device_owner"] == "network:router_interface"]
-        return filter(self._owned_resource, all_ports)
+        ports = self.list_collection(
+            'ports', ['id', 'name', 'tenant_id', 'device_owner', 'device_id'],
+            device_owner="network:router_interface")
+        return self.references(
+            (port for port in ports
+             if port["device_owner"] == "network:router_interface"),
+            parent='device_id')
+
+    def delete_resources(self, resources, workers=None):
+        """
+        Deletes interfaces from workers threads (the session's by
+        default): the routes of their routers are purged first, once
+        per router, then the interfaces are removed. Both steps share
+        the same budget of workers.
+        """
+        workers = workers or self.session.workers
+        interfaces = list(resources)
+        routers = collections.OrderedDict.fromkeys(
+            interface.parent for interface in interfaces)
+        c_name = self.__class__.__name__
+        parallel(retry(c_name, self.session.progress)(self.purge_routes),
+                 routers, workers)
+        parallel(self.deleter(self.remove_interface), interfaces, workers)
 
-    def delete(self, interface):
-        # We might need this interface to get to some ExtraRoute, which
+    def purge_routes(self, router_id):
+        # We might need an interface to get to some ExtraRoute, which
         # would mean a failure to delete it. Purge the routes first
-        # on the device router if so.
-        if interface['device_owner'] == 'network:router_interface':
-            self.client.update_router(interface['device_id'], { 'router' : { 'routes' : []}})
+        # on the device router.
+        self.client.update_router(router_id, {'router': {'routes': []}})
+
+    def remove_interface(self, interface):
         super(NeutronInterfaces, self).delete(interface)
-        self.client.remove_interface_router(interface['device_id'],
-                                            {'port_id': interface['id']})
+        self.client.remove_interface_router(interface.parent,
+                                            {'port_id': interface.id})
 
-    def resource_str(self, interface):
-        return "interface {} (id {})".format(interface['name'],
-                                             interface['id'])
+    def delete(self, interface):
+        ignore_not_found(self.purge_routes, interface.parent)
+        self.remove_interface(interface)
 
 
+@register_resources_class
 class NeutronPorts(NeutronResources):
 
+    DEPENDS_ON = ('NovaServers',)
+    RESOURCE_TYPE = 'port'
+    LISTS_ALL_TENANTS = True
+
+    def list(self):
+        ports = self.list_owned()
+        if self.session.inventory is None:
+            return ports
+        if not self.session.acts_on('NovaServers'):
+            return ports
+        return self.existing(ports)
+
     # When created, unbound ports' device_owner are "". device_owner
     # is of the form" compute:*" if it has been bound to some vm in
     # the past.
-    def list(self):
-        all_ports = [port for port in self.client.list_ports()['ports']
-                     if port["device_owner"] == ""
-                     or port["device_owner"].startswith("compute:")]
-        return filter(self._owned_resource, all_ports)
+    @inventoried
+    def list_owned(self):
+        return self.owned(self.list_all_tenants())
+
+    def existing(self, ports):
+        """
+        Drops the ports of a server that don't exist anymore. Nova deletes
+        the ports it created for a server along with it, but the listings
+        of an AdminInventory predate the deletion of the project's servers
+        by NovaServers. A single listing of the project's port IDs tells
+        them from the ports created beforehand, which are only unbound.
+        """
+        ports = list(ports)
+        if not any(port.parent for port in ports):
+            return ports
+        ids = set(port['id'] for port in self.paginated(
+            'ports', fields=['id'], tenant_id=self.project_id))
+        existing = [port for port in ports
+                    if not port.parent or port.id in ids]
+        logging.info("* Skipping {} ports deleted along with their server"
+                     .format(len(ports) - len(existing)))
+        return existing
+
+    def list_all_tenants(self):
+        ports = self.list_collection(
+            'ports', ['id', 'name', 'tenant_id', 'device_owner', 'device_id'])
+        return self.references(
+            (port for port in ports
+             if port["device_owner"] == ""
+             or port["device_owner"].startswith("compute:")),
+            parent='device_id')
 
     def delete(self, port):
         super(NeutronPorts, self).delete(port)
-        self.client.delete_port(port['id'])
-
-    def resource_str(self, port):
-        return "port {} (id {})".format(port['name'], port['id'])
+        self.client.delete_port(port.id)
 
 
+@register_resources_class
 class NeutronNetworks(NeutronResources):
 
+    DEPENDS_ON = ('NeutronInterfaces', 'NeutronPorts')
+    RESOURCE_TYPE = 'network'
+    LISTS_ALL_TENANTS = True
+
+    @inventoried
     def list(self):
-        return filter(self._owned_resource,
-                      self.client.list_networks()['networks'])
+        return self.owned(self.list_all_tenants())
+
+    def list_all_tenants(self):
+        return self.references(self.list_collection(
+            'networks', ['id', 'name', 'tenant_id']))
 
     def delete(self, net):
         """
@@ -390,56 +1419,111 @@ class NeutronNetworks(NeutronResources):
         Implying there must not be any VM on the network.
         """
         super(NeutronNetworks, self).delete(net)
-        self.client.delete_network(net['id'])
-
-    def resource_str(self, net):
-        return "network {} (id {})".format(net['name'], net['id'])
+        self.client.delete_network(net.id)
 
 
+@register_resources_class
 class NeutronSecgroups(NeutronResources):
 
+    DEPENDS_ON = ('NovaServers', 'NeutronPorts')
+    RESOURCE_TYPE = 'security group'
+    LISTS_ALL_TENANTS = True
+
+    @inventoried
     def list(self):
-        # filtering out default security group (cannot be removed)
-        def secgroup_filter(secgroup):
-            if secgroup['name'] == 'default':
-                return False
-            return self._owned_resource(secgroup)
+        return self.owned(self.list_all_tenants())
 
+    def list_all_tenants(self):
         try:
-            sgs = self.client.list_security_groups()['security_groups']
-            return filter(secgroup_filter, sgs)
+            sgs = self.list_collection('security_groups',
+                                       ['id', 'name', 'tenant_id'])
         except neutronclient.common.exceptions.NeutronClientException as err:
             if getattr(err, "status_code", None) == 404:
                 raise ResourceNotEnabled
             raise
+        # filtering out default security group (cannot be removed)
+        return self.references(sg for sg in sgs if sg['name'] != 'default')
 
     def delete(self, secgroup):
         """VMs using the security group should be deleted first"""
         super(NeutronSecgroups, self).delete(secgroup)
-        self.client.delete_security_group(secgroup['id'])
-
-    def resource_str(self, secgroup):
-        return "security group {} (id {})".format(
-            secgroup['name'], secgroup['id'])
+        self.client.delete_security_group(secgroup.id)
 
 
+@register_resources_class
 class NeutronFloatingIps(NeutronResources):
 
+    RESOURCE_TYPE = 'floating ip'
+    LISTS_ALL_TENANTS = True
+
+    @inventoried
     def list(self):
-        return filter(self._owned_resource,
-                      self.client.list_floatingips()['floatingips'])
+        return self.owned(self.list_all_tenants())
+
+    def list_all_tenants(self):
+        return self.references(self.list_collection(
+            'floatingips', ['id', 'floating_ip_address', 'tenant_id']),
+            name='floating_ip_address')
 
     def delete(self, floating_ip):
         super(NeutronFloatingIps, self).delete(floating_ip)
-        self.client.delete_floatingip(floating_ip['id'])
+        self.client.delete_floatingip(floating_ip.id)
+
+
+@register_resources_class
+class HeatStacks(Resources):
+
+    """
+    Heat stacks are purged first: deleting a stack deletes the resources
+    it created (servers, volumes, networks...) and its nested stacks,
+    leaving only the other resources to the next classes. Stacks are
+    deleted concurrently, then a single listing per poll waits for all
+    of them to be deleted.
+    """
+
+    SERVICE_TYPE = 'orchestration'
+    RESOURCE_TYPE = 'stack'
+    LISTS_ALL_TENANTS = True
+
+    def __init__(self, session):
+        super(HeatStacks, self).__init__(session)
+        self.client = heat_client.Client(
+            session.get_endpoint("orchestration"),
+            token=session.token, insecure=session.insecure)
+
+    @inventoried
+    def list(self):
+        # Nested stacks are not listed, they are deleted with their parent
+        return (self.reference(stack.id, stack.stack_name, raw=stack)
+                for stack in self.client.stacks.list())
+
+    def list_all_tenants(self):
+        return (self.reference(stack.id, stack.stack_name, raw=stack,
+                               owner=stack.project)
+                for stack in self.client.stacks.list(global_tenant=True))
 
-    def resource_str(self, floating_ip):
-        return "floating ip {} (id {})".format(
-            floating_ip['floating_ip_address'], floating_ip['id'])
+    def statuses(self):
+        return dict((stack.id, stack.stack_status)
+                    for stack in self.client.stacks.list()
+                    if stack.stack_status != 'DELETE_COMPLETE')
 
+    def delete_resources(self, resources, workers=1):
+        stacks = list(resources)
+        super(HeatStacks, self).delete_resources(stacks, self.session.workers)
+        self.wait_deleted(stacks, self.statuses, failed=('DELETE_FAILED',))
 
+    def delete(self, stack):
+        super(HeatStacks, self).delete(stack)
+        self.client.stacks.delete(stack.id)
+
+
+@register_resources_class
 class NovaServers(Resources):
 
+    SERVICE_TYPE = 'compute'
+    RESOURCE_TYPE = 'server'
+    LISTS_ALL_TENANTS = True
+
     def __init__(self, session):
         super(NovaServers, self).__init__(session)
         self.client = nova_client.Client(
@@ -451,47 +1535,137 @@ class NovaServers(Resources):
 
     """Manage nova resources"""
 
+    @inventoried
     def list(self):
-        return self.client.servers.list()
+        if self.since is None:
+            servers = self.list_paginated(self.session.detailed)
+        else:
+            # Servers deleted since then are listed too
+            servers = (server for server in self.list_paginated(
+                True, **{'changes-since': self.since + 'Z'})
+                if server.status != 'DELETED')
+        return (self.reference(server.id, server.name, raw=server)
+                for server in servers)
+
+    def list_all_tenants(self):
+        return (self.reference(server.id, server.name, raw=server,
+                               owner=server.tenant_id)
+                for server in self.list_paginated(True, all_tenants=1))
+
+    def list_paginated(self, detailed, **search_opts):
+        def list_page(marker, limit):
+            return self.client.servers.list(
+                detailed=detailed, search_opts=search_opts, marker=marker,
+                limit=limit)
+        return paginate(list_page, self.session.page_size)
+
+    def aggregate_count(self):
+        return absolute_limit(self.client.limits.get(), 'totalInstancesUsed')
+
+    def statuses(self, all_tenants=False):
+        """
+        Returns the statuses of the servers of the session's project, or
+        of all projects if all_tenants.
+        """
+        search_opts = {'all_tenants': 1} if all_tenants else {}
+        statuses = dict((server.id, server.status)
+                        for server in self.list_paginated(True, **search_opts))
+        if not self.session.force_delete:
+            # Soft deleted servers remain until Nova reclaims them
+            statuses = dict((server_id, status)
+                            for server_id, status in statuses.items()
+                            if status != 'SOFT_DELETED')
+        return statuses
+
+    def delete_resources(self, resources, workers=1):
+        """
+        Deletes all servers at once, then waits until they are gone so
+        that the resources they use can be deleted by the next classes.
+        Servers of other projects (e.g. orphans) are polled across all
+        projects.
+        """
+        servers = list(resources)
+        super(NovaServers, self).delete_resources(servers,
+                                                  self.session.workers)
+        all_tenants = any(server.owner not in (None, self.project_id)
+                          for server in servers)
+        self.wait_deleted(servers, lambda: self.statuses(all_tenants),
+                          failed=('SOFT_DELETED',), delete=self.force_delete)
 
     def delete(self, server):
         super(NovaServers, self).delete(server)
-        self.client.servers.delete(server)
+        self.client.servers.delete(server.id)
 
-    def resource_str(self, server):
-        return "server {} (id {})".format(server.name, server.id)
+    def force_delete(self, server):
+        """Deletes a soft deleted server right away."""
+        logging.info("* Force deleting {}.".format(self.resource_str(server)))
+        self.client.servers.force_delete(server.id)
 
 
+@register_resources_class
 class GlanceImages(Resources):
 
+    SERVICE_TYPE = 'image'
+    RESOURCE_TYPE = 'image'
+    LISTS_ALL_TENANTS = True
+    PROTECTED_TYPE = 'protected image'
+
     def __init__(self, session):
+        super(GlanceImages, self).__init__(session)
         self.client = glance_client.Client(
             endpoint=session.get_endpoint("image"),
             token=session.token, insecure=session.insecure)
         self.project_id = session.project_id
 
+    @inventoried
     def list(self):
-        try:
-            return filter(self._owned_resource, self.client.images.list())
-        except:
-            return ''
+        return filter(self._owned_resource, self.list_all_tenants())
+
+    def list_all_tenants(self):
+        if self.since is None:
+            images = self.client.images.list(page_size=self.session.page_size)
+        else:
+            # The listing stops at the first image created before since
+            images = itertools.takewhile(
+                lambda image: image.created_at >= self.since,
+                self.client.images.list(
+                    page_size=self.session.page_size,
+                    filters={'sort_key': 'created_at', 'sort_dir': 'desc'}))
+        return (self.reference_image(image) for image in images)
+
+    def reference_image(self, image):
+        ref = self.reference(image.id, image.name, owner=image.owner,
+                             raw=image)
+        # Only protected images need to be unprotected before deletion
+        if getattr(image, 'protected', False):
+            ref.type = self.PROTECTED_TYPE
+        return ref
+
+    def delete_resources(self, resources, workers=1):
+        "Images are deleted concurrently."
+        super(GlanceImages, self).delete_resources(resources,
+                                                   self.session.workers)
 
     def delete(self, image):
-        self.client.images.update(image.id, protected=False)
         super(GlanceImages, self).delete(image)
+        if image.type == self.PROTECTED_TYPE:
+            ignore_not_found(self.client.images.update, image.id,
+                             protected=False)
         self.client.images.delete(image.id)
 
-    def resource_str(self, image):
-        return "image {} (id {})".format(image.name, image.id)
-
     def _owned_resource(self, res):
         # Only considering resources owned by project
-        return res.owner == self.project_id
+        return self.owner(res) == self.project_id
 
 
 class CeilometerAlarms(Resources):
 
+    SERVICE_TYPE = 'metering'
+    RESOURCE_TYPE = 'alarm'
+
     def __init__(self, session):
+        super(CeilometerAlarms, self).__init__(session)
+
         # Ceilometer Client needs a method that returns the token
         def get_token():
             return session.token
@@ -504,27 +1678,382 @@ class CeilometerAlarms(Resources):
         query = [{'field': 'project_id',
                   'op': 'eq',
                   'value': self.project_id}]
-        return self.client.alarms.list(q=query)
+        return (self.reference(alarm.alarm_id, alarm.name, raw=alarm)
+                for alarm in self.client.alarms.list(q=query))
 
     def delete(self, alarm):
         super(CeilometerAlarms, self).delete(alarm)
-        self.client.alarms.delete(alarm.alarm_id)
+        self.client.alarms.delete(alarm.id)
 
     def resource_str(self, alarm):
         return "alarm {}".format(alarm.name)
 
 
+class AdminInventory(object):
+
+    """
+    Serves the listings of a batch of projects from a single listing of
+    each resources type across all projects, indexed by owner. This
+    requires the admin role. Resources created after a type has been
+    indexed are not listed.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def list(self, resources):
+        c_name = resources.__class__.__name__
+        if c_name not in self.indexes:
+            logging.info("* Indexing {} of all projects".format(c_name))
+            index = {}
+            for res in resources.list_all_tenants():
+                index.setdefault(resources.owner(res), []).append(res)
+            self.indexes[c_name] = index
+        return self.indexes[c_name].get(resources.session.project_id, [])
+
+
+class InventoryStore(object):
+
+    """
+    SQLite store of the resources listed by successive runs, indexed by
+    project, resources class and ID. Listings can be compared with the
+    ones of a previous run, and queried without calling the APIs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Run listings are recorded in
+        self.run = None
+        db = self.connect()
+        try:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS resources (
+                    run INTEGER NOT NULL,
+                    project_id TEXT NOT NULL,
+                    project_name TEXT,
+                    resources_class TEXT NOT NULL,
+                    parent TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    name TEXT,
+                    type TEXT,
+                    PRIMARY KEY (run, project_id, resources_class, parent, id));
+                CREATE TABLE IF NOT EXISTS listings (
+                    run INTEGER NOT NULL,
+                    project_id TEXT NOT NULL,
+                    resources_class TEXT NOT NULL,
+                    PRIMARY KEY (run, project_id, resources_class));
+                CREATE INDEX IF NOT EXISTS resources_by_project
+                    ON resources (project_id, resources_class, parent, id);
+                CREATE TABLE IF NOT EXISTS sweeps (
+                    project_id TEXT NOT NULL,
+                    resources_class TEXT NOT NULL,
+                    swept REAL NOT NULL,
+                    reconciled REAL NOT NULL,
+                    PRIMARY KEY (project_id, resources_class));
+            """)
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def key(ref):
+        """Returns the key identifying a ResourceRef within its class."""
+        return (ref.parent or '', ref.id)
+
+    def last_run(self):
+        """Returns the ID of the last run, 0 if there is none."""
+        db = self.connect()
+        try:
+            return db.execute("SELECT MAX(id) FROM runs").fetchone()[0] or 0
+        finally:
+            db.close()
+
+    def start_run(self):
+        """Starts recording the listings of a new run."""
+        db = self.connect()
+        try:
+            with db:
+                self.run = db.execute("INSERT INTO runs (started) VALUES (?)",
+                                      (time.time(),)).lastrowid
+        finally:
+            db.close()
+        return self.run
+
+    def record(self, resources, refs):
+        """
+        Yields the references refs listed by resources (a Resources
+        instance), recording them in the current run by batches of a
+        page. Once refs are exhausted, the listing is recorded as
+        complete, so that the run can be used as a baseline.
+        """
+        session = resources.session
+        c_name = resources.__class__.__name__
+        row = (self.run, session.project_id, session.project_name, c_name)
+        batch = []
+        try:
+            for ref in refs:
+                batch.append(row + self.key(ref) + (ref.name, ref.type))
+                if len(batch) >= session.page_size:
+                    self.insert(batch)
+                    batch = []
+                yield ref
+        finally:
+            self.insert(batch)
+        if self.run is None:
+            return
+        db = self.connect()
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+                           (self.run, session.project_id, c_name))
+        finally:
+            db.close()
+
+    def insert(self, rows):
+        if not rows:
+            return
+        db = self.connect()
+        try:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO resources VALUES "
+                               "(?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            db.close()
+
+    def query(self, run, project=None, resources_class=None):
+        """
+        Returns the (project ID, resources class, ResourceRef) listed by
+        run, for the project given by name or ID and the resources class
+        if set.
+        """
+        query = ("SELECT project_id, resources_class, parent, id, name, type "
+                 "FROM resources WHERE run = ?")
+        parameters = [run]
+        if project is not None:
+            query += " AND (project_id = ? OR project_name = ?)"
+            parameters += [project, project]
+        if resources_class is not None:
+            query += " AND resources_class = ?"
+            parameters.append(resources_class)
+        db = self.connect()
+        try:
+            rows = db.execute(query + " ORDER BY rowid", parameters).fetchall()
+        finally:
+            db.close()
+        return [(project_id, rc, ResourceRef(res_type, res_id, name,
+                                             parent or None, project_id))
+                for project_id, rc, parent, res_id, name, res_type in rows]
+
+    def last_sweep(self, project_id, resources_class):
+        """
+        Returns the start times of the last purge of resources_class in
+        project_id, and of its last purge that listed all resources, None
+        if it was never purged.
+        """
+        db = self.connect()
+        try:
+            return db.execute(
+                "SELECT swept, reconciled FROM sweeps "
+                "WHERE project_id = ? AND resources_class = ?",
+                (project_id, resources_class)).fetchone()
+        finally:
+            db.close()
+
+    def record_sweep(self, project_id, resources_class, swept, full):
+        """
+        Records that resources_class was purged from project_id, from
+        a listing of all resources if full.
+        """
+        sweep = self.last_sweep(project_id, resources_class)
+        reconciled = swept if full or sweep is None else sweep[1]
+        db = self.connect()
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?, ?)",
+                           (project_id, resources_class, swept, reconciled))
+        finally:
+            db.close()
+
+    def references(self, run, project, resources_class):
+        return [ref for _, _, ref in self.query(run, project, resources_class)]
+
+    def keys(self, run, project, resources_class):
+        return set(self.key(ref) for ref in
+                   self.references(run, project, resources_class))
+
+    def listed(self, run, project_id, resources_class):
+        """
+        Returns whether run listed all the resources of resources_class
+        in project_id.
+        """
+        db = self.connect()
+        try:
+            return db.execute(
+                "SELECT 1 FROM listings WHERE run = ? AND project_id = ? "
+                "AND resources_class = ?",
+                (run, project_id, resources_class)).fetchone() is not None
+        finally:
+            db.close()
+
+
+class Progress(object):
+
+    """
+    Counts the resources listed, deleted, being retried and failed by
+    resources class, and reports them along with the deletion rate and
+    the remaining time every interval seconds, from a background
+    thread. The remaining time is only estimated once the listing of a
+    class is done, i.e. its listed count is final. On a terminal, the
+    report of the class being purged is updated in place, otherwise a
+    line is written per report and class.
+    """
+
+    FIELDS = ('listed', 'deleted', 'retrying', 'failed')
+
+    def __init__(self, stream=None, interval=None):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        # Terminals are updated every second
+        self.interval = interval or (1 if self.tty else PROGRESS_INTERVAL)
+        self.lock = threading.Lock()
+        self.counts = collections.OrderedDict()
+        # Classes whose listing is done, i.e. whose listed count is final
+        self.listings_done = set()
+        # Counts at the previous report, and when it was made
+        self.reported = {}
+        self.reported_at = time.time()
+        # Class whose counts changed last, reported even when they don't
+        # change anymore so that a stalled purge shows
+        self.active = None
+        # Class last reported on a terminal
+        self.shown = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, resources_class, field, n=1):
+        with self.lock:
+            counts = self.counts.get(resources_class)
+            if counts is None:
+                counts = dict.fromkeys(self.FIELDS, 0)
+                self.counts[resources_class] = counts
+            counts[field] += n
+
+    def counted(self, resources_class, resources):
+        """
+        Yields resources, counting them as listed, and the listing as
+        done once resources are exhausted.
+        """
+        for resource in resources:
+            self.add(resources_class, 'listed')
+            yield resource
+        self.listing_done(resources_class)
+
+    def listing_done(self, resources_class):
+        with self.lock:
+            self.listings_done.add(resources_class)
+
+    def start(self):
+        def report():
+            while not self.stopped.wait(self.interval):
+                self.report()
+        self.thread = threading.Thread(target=report)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.report(final=True)
+
+    def line(self, resources_class, counts, elapsed):
+        deleted = counts['deleted'] - self.reported.get(
+            resources_class, {}).get('deleted', 0)
+        rate = deleted / elapsed if elapsed > 0 else 0
+        remaining = counts['listed'] - counts['deleted'] - counts['failed']
+        eta = "-"
+        if resources_class not in self.listings_done:
+            eta = "unknown"
+        elif rate and remaining > 0:
+            minutes, seconds = divmod(int(remaining / rate), 60)
+            eta = "{}:{:02d}:{:02d}".format(minutes // 60, minutes % 60,
+                                            seconds)
+        return ("* {}: {listed} listed, {deleted} deleted, {retrying} "
+                "retrying, {failed} failed, {rate:.1f} deletes/s, "
+                "ETA {eta}".format(resources_class, rate=rate, eta=eta,
+                                   **counts))
+
+    def report(self, final=False):
+        """
+        Reports the classes whose counts changed since the last report,
+        and the last active class.
+        """
+        now = time.time()
+        with self.lock:
+            changed = [(c_name, dict(counts))
+                       for c_name, counts in self.counts.items()
+                       if counts != self.reported.get(c_name)]
+            if changed:
+                self.active = changed[-1][0]
+            elif self.active is not None and not final:
+                changed = [(self.active, dict(self.counts[self.active]))]
+            elapsed = now - self.reported_at
+            lines = [(c_name, self.line(c_name, counts, elapsed))
+                     for c_name, counts in changed]
+        for c_name, counts in changed:
+            self.reported[c_name] = counts
+        self.reported_at = now
+        if not self.tty:
+            for _, line in lines:
+                self.stream.write("{} {}\n".format(
+                    time.strftime("%Y-%m-%d %H:%M:%S"), line))
+        else:
+            for c_name, line in lines:
+                if self.shown is not None and self.shown != c_name:
+                    # The previous class is done, its last report is kept
+                    self.stream.write("\n")
+                self.stream.write("\r\033[K" + line)
+                self.shown = c_name
+            if final and self.shown is not None:
+                self.stream.write("\n")
+        self.stream.flush()
+
+
 class KeystoneManager(object):
 
     """Manages Keystone queries"""
 
-    def __init__(self, username, password, project, auth_url, insecure, **kwargs):
-        self.client = keystone_client.Client(
+    def __init__(self, username, password, project, auth_url, insecure,
+                 cache_dir=None, cache_ttl=CACHE_TTL, **kwargs):
+        credentials = dict(
             username=username, password=password,
             tenant_name=project, auth_url=auth_url,
             insecure=insecure, **kwargs)
+        self.auth_cache = None
+        if cache_dir:
+            self.auth_cache = AuthCache(cache_dir, **credentials)
+            self.client = self.auth_cache.client()
+        else:
+            self.client = keystone_client.Client(**credentials)
+        self.auth_url = auth_url
         self.admin_role_id = None
+        if self.auth_cache:
+            self.admin_role_id = self.auth_cache.get('admin_role_id')
         self.tenant_info = None
+        # Projects IDs by name, and projects listed during this run by ID
+        # (None if the IDs index was loaded from the cache)
+        self.project_ids = None
+        self.projects = None
+        self.index_lock = threading.Lock()
+        self.projects_cache = None
+        if cache_dir:
+            self.projects_cache = os.path.join(cache_dir, 'projects.json')
+        self.cache_ttl = cache_ttl
 
     def get_project_id(self, project_name_or_id=None):
         """
@@ -536,23 +2065,69 @@ class KeystoneManager(object):
         if project_name_or_id is None:
             return self.client.tenant_id
 
+        self.tenant_info = self.get_project(project_name_or_id)
+        return self.tenant_info.id
+
+    def get_project(self, project_name_or_id, fresh=False, indexed=False):
+        """
+        Returns the project given by name or ID. A cached index that
+        doesn't resolve a name to a project bearing it (e.g. renamed
+        project, or name reused by another project) is rebuilt.
+        If fresh, the project is fetched from Keystone rather than from
+        the index, which is also rebuilt if it predates the project:
+        long running processes see the projects created or updated
+        since they started. indexed tells whether the index was already
+        rebuilt for this call.
+        """
+        with self.index_lock:
+            if self.project_ids is None and not self.load_projects_index():
+                self.index_projects()
+                indexed = True
+        project_id = self.project_ids.get(project_name_or_id)
         try:
-            self.tenant_info = self.client.tenants.get(project_name_or_id)
-            # If it doesn't raise an 404, project_name_or_id is
-            # already the project's id
-            project_id = project_name_or_id
+            tenant = None
+            if not fresh:
+                tenant = (self.projects or {}).get(
+                    project_id or project_name_or_id)
+            if tenant is None:
+                # Project created after the listing, or cached index
+                tenant = self.client.tenants.get(project_id or project_name_or_id)
+            if project_id is None or tenant.name == project_name_or_id:
+                return tenant
         except api_exceptions.NotFound:
-            try:
-                # Can raise api_exceptions.Forbidden:
-                tenants = self.client.tenants.list()
-                project_id = filter(
-                    lambda x: x.name == project_name_or_id, tenants)[0].id
-            except IndexError:
-                raise NoSuchProject(project_name_or_id)
-
-        if not self.tenant_info:
-            self.tenant_info = self.client.tenants.get(project_id)
-        return project_id
+            pass
+        if indexed or (self.projects is not None and not fresh):
+            raise NoSuchProject(project_name_or_id)
+        # Stale index
+        with self.index_lock:
+            self.index_projects()
+        return self.get_project(project_name_or_id, fresh, indexed=True)
+
+    def index_projects(self):
+        """
+        Indexes the projects IDs by name from a single listing, and
+        caches the index if a cache directory is set.
+        """
+        # Can raise api_exceptions.Forbidden:
+        tenants = self.client.tenants.list()
+        self.projects = dict((tenant.id, tenant) for tenant in tenants)
+        self.project_ids = dict((tenant.name, tenant.id) for tenant in tenants)
+        if self.projects_cache:
+            save_cache(self.projects_cache, {'auth_url': self.auth_url,
+                                             'project_ids': self.project_ids})
+
+    def load_projects_index(self):
+        """
+        Loads the projects IDs index from the cache, returns whether
+        there was a valid one.
+        """
+        if not self.projects_cache:
+            return False
+        cache = load_cache(self.projects_cache, self.cache_ttl)
+        if not cache or cache.get('auth_url') != self.auth_url:
+            return False
+        self.project_ids = cache['project_ids']
+        return True
 
     def enable_project(self, project_id):
         logging.info("* Enabling project {}.".format(project_id))
@@ -566,6 +2141,8 @@ class KeystoneManager(object):
         if not self.admin_role_id:
             roles = self.client.roles.list()
             self.admin_role_id = filter(lambda x: x.name == "admin", roles)[0].id
+            if self.auth_cache:
+                self.auth_cache.set('admin_role_id', self.admin_role_id)
         return self.admin_role_id
 
     def become_project_admin(self, project_id):
@@ -588,39 +2165,307 @@ class KeystoneManager(object):
         logging.info("* Deleting project {}.".format(project_id))
         self.client.tenants.delete(project_id)
 
+    def orphan_filter(self):
+        """
+        Returns a function telling whether a project ID belongs to a
+        project that doesn't exist. Projects are listed once, unknown IDs
+        are checked individually so that projects created after the
+        listing are not mistaken for deleted ones.
+        """
+        self.index_projects()
+        existing = set(self.projects)
+        deleted = set()
+
+        def is_orphan(project_id):
+            if not project_id or project_id in existing:
+                return False
+            if project_id not in deleted:
+                try:
+                    self.client.tenants.get(project_id)
+                except api_exceptions.NotFound:
+                    deleted.add(project_id)
+                else:
+                    existing.add(project_id)
+                    return False
+            return True
+        return is_orphan
+
+
+def load_resources_plugins():
+    """
+    Registers the resources classes published by installed packages
+    under the RESOURCES_ENTRY_POINT entry point group. The group is for
+    third-party classes: entry points named after built-in classes are
+    ignored, the built-in classes being registered by this module.
+    """
+    for entry_point in pkg_resources.iter_entry_points(RESOURCES_ENTRY_POINT):
+        if entry_point.name in RESOURCES_CLASSES:
+            logging.warning("Ignoring resources class {}, which is "
+                            "built-in".format(entry_point))
+            continue
+        try:
+            cls = entry_point.load()
+        except Exception as exc:
+            logging.warning("Unable to load resources class {}: {}".format(
+                entry_point, exc))
+            continue
+        register_resources_class(cls)
+
+
+def resources_classes(names=None):
+    """
+    Returns the registered resources classes named in names (all of
+    them if names is None), ordered so that every class comes after
+    the classes it depends on.
+    """
+    if names is None:
+        names = RESOURCES_REGISTRY.keys()
+    names = set(names)
+    # Built-in classes keep their historical order, plugins follow
+    pending = [rc for rc in RESOURCES_CLASSES if rc in names]
+    pending += sorted(names.difference(RESOURCES_CLASSES))
+    ordered = []
+    while pending:
+        for rc in pending:
+            deps = names.intersection(RESOURCES_REGISTRY[rc].DEPENDS_ON)
+            if deps.issubset(ordered):
+                break
+        else:
+            raise ValueError("Circular dependency between resources "
+                             "classes {}".format(", ".join(pending)))
+        pending.remove(rc)
+        ordered.append(rc)
+    return [RESOURCES_REGISTRY[rc] for rc in ordered]
+
+
+def select_resources(include=None, exclude=None, with_dependencies=False):
+    """
+    Returns the names of the resources classes to act on. include and
+    exclude are lists of class names, or of class names prefixes such as
+    "Swift" (case insensitive). All classes are included if include is
+    None. If with_dependencies is set, the classes the included classes
+    depend on are included as well.
+    """
+    def resolve(names):
+        resolved = set()
+        for name in names:
+            if name in RESOURCES_REGISTRY:
+                resolved.add(name)
+                continue
+            matches = [rc for rc in RESOURCES_REGISTRY
+                       if rc.lower().startswith(name.lower())]
+            if not matches:
+                raise ValueError("Unknown resources type: {}".format(name))
+            resolved.update(matches)
+        return resolved
+
+    if include is None:
+        selected = set(RESOURCES_REGISTRY)
+    else:
+        selected = resolve(include)
+    if with_dependencies:
+        pending = list(selected)
+        while pending:
+            for dep in RESOURCES_REGISTRY[pending.pop()].DEPENDS_ON:
+                if dep in RESOURCES_REGISTRY and dep not in selected:
+                    selected.add(dep)
+                    pending.append(dep)
+    if exclude:
+        selected.difference_update(resolve(exclude))
+    return selected
+
 
 def perform_on_project(admin_name, password, project, auth_url,
                        endpoint_type='publicURL', region_name=None,
-                       action='dump', insecure=False):
+                       action='dump', insecure=False, resources=None,
+                       inventory=None, detailed=False, page_size=PAGE_SIZE,
+                       workers=WORKERS, cache_dir=None, store=None,
+                       baseline=None, incremental=False,
+                       reconcile_interval=RECONCILE_INTERVAL,
+                       force_delete=False, progress=None, aborted=None):
     """
     Perform provided action on all resources of project.
-    action can be: 'purge' or 'dump'
+    action can be: 'purge', 'dump' or 'summary'
+    resources restricts the action to the named resources classes.
+    inventory is an AdminInventory shared by the projects of a batch.
+    detailed makes 'dump' fetch and display all resources attributes.
+    page_size is the number of resources fetched per listing request.
+    workers is the number of concurrent deletions, where supported.
+    cache_dir is where to cache the session's token and catalog, which
+    is only relevant when project is the admin project.
+    store is an InventoryStore recording the listings, and baseline the
+    run of the store that 'dump' compares listings with and 'purge'
+    preserves the resources of.
+    incremental makes 'purge' only list the resources created since the
+    last purge recorded in store, and list them all once every
+    reconcile_interval seconds.
+    force_delete makes 'purge' force the deletion of soft deleted servers.
+    progress is a Progress counting the resources purged.
+    aborted is an Event aborting 'purge' between two resources types
+    once set, raising PurgeAborted.
     """
     session = Session(admin_name, password, project, auth_url,
-                      endpoint_type, region_name, insecure)
+                      endpoint_type, region_name, insecure, inventory,
+                      detailed, page_size, workers, resources, cache_dir,
+                      store, baseline, incremental, reconcile_interval,
+                      force_delete, progress)
     error = None
-    for rc in RESOURCES_CLASSES:
-        try:
-            resources = globals()[rc](session)
-            res_actions = {'purge': resources.purge,
-                           'dump': resources.dump}
-            res_actions[action]()
-        except (EndpointNotFound,
-                keystoneclient.openstack.common.apiclient.exceptions.EndpointNotFound,
-                neutronclient.common.exceptions.EndpointNotFound,
-                cinderclient.exceptions.EndpointNotFound,
-                novaclient.exceptions.EndpointNotFound,
-                ResourceNotEnabled):
-            # If service is not in Keystone's services catalog, ignoring it
-            pass
-        except (ceilometerclient.exc.InvalidEndpoint, glanceclient.exc.InvalidEndpoint) as e:
-            logging.warning(
-                "Unable to connect to {} endpoint : {}".format(rc, e.message))
-            error = InvalidEndpoint(rc)
+    load_resources_plugins()
+    classes = []
+    for resources_class in resources_classes(resources):
+        if not session.has_service(resources_class.SERVICE_TYPE):
+            # Not building clients for services missing from the catalog
+            logging.info("* Skipping {}: no {} endpoint".format(
+                resources_class.__name__, resources_class.SERVICE_TYPE))
+            continue
+        classes.append(resources_class)
+
+    if action == 'purge':
+        for resources_class in classes:
+            if aborted is not None and aborted.is_set():
+                raise PurgeAborted(project)
+            error = perform_on_resources(session, resources_class,
+                                         action) or error
+    else:
+        error = list_concurrently(session, classes, action)
     if error:
         raise error
 
 
+def list_concurrently(session, classes, action):
+    """
+    Performs action ('dump' or 'summary') on the resources of classes,
+    listing all of them at the same time, since listing is read-only.
+    Their output is displayed in order as it comes, each class queuing
+    at most a page of lines ahead of the display. Returns the last
+    InvalidEndpoint error encountered, if any.
+    """
+    error = None
+    stopped = threading.Event()
+    queues = [Queue.Queue(session.page_size) for _ in classes]
+
+    def perform(resources_class, lines):
+        def put(item):
+            # Listing is given up once the display stopped on an error
+            while not stopped.is_set():
+                try:
+                    lines.put(item, timeout=TIMEOUT)
+                    return
+                except Queue.Full:
+                    pass
+            raise ListingStopped()
+
+        try:
+            outcome = (perform_on_resources(
+                session, resources_class, action,
+                lambda line: put((line, None))), None)
+        except ListingStopped:
+            return
+        except Exception as exc:
+            outcome = (None, exc)
+        try:
+            put((None, outcome))
+        except ListingStopped:
+            pass
+
+    threads = [threading.Thread(target=perform, args=args)
+               for args in zip(classes, queues)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for lines in queues:
+            line, outcome = lines.get()
+            while outcome is None:
+                print(line)
+                line, outcome = lines.get()
+            exc, unexpected = outcome
+            if unexpected is not None:
+                raise unexpected
+            error = exc or error
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+    return error
+
+
+def display(line):
+    print(line)
+
+
+def perform_on_resources(session, resources_class, action, output=display):
+    """
+    Perform provided action on the resources of resources_class, passing
+    the lines to display to output as they come. Returns the
+    InvalidEndpoint error encountered if any.
+    """
+    rc = resources_class.__name__
+    try:
+        resources = resources_class(session)
+        if action == 'purge':
+            resources.purge()
+        elif action == 'summary':
+            output(resources.summary_str())
+        else:
+            for line in resources.dump_lines():
+                output(line)
+        return None
+    except (EndpointNotFound,
+            keystoneclient.openstack.common.apiclient.exceptions.EndpointNotFound,
+            neutronclient.common.exceptions.EndpointNotFound,
+            cinderclient.exceptions.EndpointNotFound,
+            novaclient.exceptions.EndpointNotFound,
+            ResourceNotEnabled):
+        # If service is not in Keystone's services catalog, ignoring it
+        return None
+    except (ceilometerclient.exc.InvalidEndpoint, glanceclient.exc.InvalidEndpoint) as e:
+        logging.warning(
+            "Unable to connect to {} endpoint : {}".format(rc, e.message))
+        return InvalidEndpoint(rc)
+
+
+def sweep_orphans(admin_name, password, project, auth_url, is_orphan,
+                  endpoint_type='publicURL', region_name=None,
+                  action='dump', insecure=False, resources=None,
+                  workers=WORKERS, page_size=PAGE_SIZE, cache_dir=None,
+                  progress=None, force_delete=False):
+    """
+    Perform provided action on the resources of all projects whose
+    owner is an orphan according to is_orphan. project is the ID of the
+    admin project used to authenticate.
+    action can be: 'purge' or 'dump'
+    """
+    session = Session(admin_name, password, project, auth_url,
+                      endpoint_type, region_name, insecure,
+                      page_size=page_size, workers=workers,
+                      cache_dir=cache_dir, force_delete=force_delete,
+                      progress=progress)
+    for resources_class in resources_classes(resources):
+        if not resources_class.LISTS_ALL_TENANTS:
+            continue
+        if not session.has_service(resources_class.SERVICE_TYPE):
+            continue
+        rc = resources_class.__name__
+        try:
+            res = resources_class(session)
+            orphans = (resource for resource in res.list_all_tenants()
+                       if is_orphan(res.owner(resource)))
+            if action == 'purge':
+                if progress is not None:
+                    orphans = progress.counted(rc, orphans)
+                logging.info("* Purging orphaned {}".format(rc))
+                res.delete_resources(orphans, workers)
+            else:
+                print("* Orphaned resources type: {}".format(rc))
+                for resource in orphans:
+                    print("{} of project {}".format(res.resource_str(resource),
+                                                    res.owner(resource)))
+                print("")
+        except ResourceNotEnabled:
+            pass
+
+
 # From Russell Heilling
 # http://stackoverflow.com/questions/10551117/setting-options-from-environment-variables-when-using-argparse
 class EnvDefault(argparse.Action):
@@ -642,12 +2487,36 @@ def parse_args():
     desc = "Purge resources from an Openstack project."
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument("--verbose", action="store_true",
-                        help="Makes output verbose")
+                        help="Makes output verbose. With --dry-run, displays "
+                             "all resources attributes.")
     parser.add_argument("--dry-run", action="store_true",
                         help="List project's resources")
+    parser.add_argument("--summary", action="store_true",
+                        help="Only display the number of resources of each "
+                             "type, from aggregate counts where available. "
+                             "Implies --dry-run.")
     parser.add_argument("--dont-delete-project", action="store_true",
                         help="Executes cleanup script without removing the project. "
                              "Warning: all project resources will still be deleted.")
+    parser.add_argument("--resources", default=None,
+                        type=lambda names: names.split(","),
+                        help="Comma separated list of resources types "
+                             "(e.g. SwiftObjects,SwiftContainers) or resources "
+                             "types prefixes (e.g. Swift) to act on. Defaults "
+                             "to all resources types. The project is not "
+                             "deleted when a subset of resources is selected.")
+    parser.add_argument("--exclude-resources", default=None,
+                        type=lambda names: names.split(","),
+                        help="Comma separated list of resources types or "
+                             "resources types prefixes to leave untouched.")
+    parser.add_argument("--with-dependencies", action="store_true",
+                        help="Also act on the resources types that the types "
+                             "selected with --resources depend on.")
+    parser.add_argument("--force-delete", action="store_true",
+                        help="Force the deletion of the servers that Nova "
+                             "soft deletes (see reclaim_instance_interval), "
+                             "instead of leaving them until Nova reclaims "
+                             "them.")
     parser.add_argument("--region-name", action=EnvDefault, required=False,
                         envvar='OS_REGION_NAME', default=None,
                         help="Region to use. Defaults to env[OS_REGION_NAME] "
@@ -676,13 +2545,97 @@ def parse_args():
                         help="Authentication URL. Defaults to "
                              "env[OS_AUTH_URL].")
     parser.add_argument("--cleanup-project", required=False, default=None,
+                        action="append",
                         help="ID or Name of project to purge. Not required "
                              "if --own-project has been set. Using --cleanup-project "
-                             "requires to authenticate with admin credentials.")
+                             "requires to authenticate with admin credentials. "
+                             "Can be repeated to purge several projects.")
+    parser.add_argument("--admin-inventory", action="store_true",
+                        help="When purging several projects, list each "
+                             "resources type once for all projects instead "
+                             "of once per project. Requires --cleanup-project.")
     parser.add_argument("--own-project", action="store_true",
                         help="Delete resources of the project used to "
                              "authenticate. Useful if you don't have the "
                              "admin credentials of the platform.")
+    parser.add_argument("--sweep-orphans", action="store_true",
+                        help="Delete resources of projects that don't exist "
+                             "anymore. Swift accounts can't be listed and "
+                             "are not swept. Requires admin credentials.")
+    parser.add_argument("--serve", default=None, metavar="SPOOL_DIR",
+                        help="Run as a daemon purging the projects requested "
+                             "in SPOOL_DIR: each <request>.json file, holding "
+                             "{\"project\": <name or ID>}, is replaced by a "
+                             "<request>.result file. Requires admin "
+                             "credentials.")
+    parser.add_argument("--fleet", default=None, metavar="WORKLIST",
+                        help="Purge the projects of the SQLite file WORKLIST, "
+                             "shared with ospurge processes on other hosts "
+                             "(e.g. over NFS). Projects given with "
+                             "--cleanup-project are added to it first. Each "
+                             "project is leased by a single process at a "
+                             "time. Requires admin credentials.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of projects purged at the same time "
+                             "with --serve. Defaults to 1.")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Maximum number of purges started per minute "
+                             "with --serve. Unlimited by default.")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Number of concurrent deletions, e.g. of Swift "
+                             "objects or when sweeping orphans, and of "
+                             "projects prepared ahead of their purge when "
+                             "purging several projects. Defaults to "
+                             "{}.".format(WORKERS))
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="Number of resources fetched per listing request, "
+                             "at most (APIs cap it, e.g. Nova to its "
+                             "osapi_max_limit). Defaults to "
+                             "{}.".format(PAGE_SIZE))
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory where to cache Keystone data between "
+                             "runs: the projects names to IDs index, and the "
+                             "admin project's token, service catalog and "
+                             "admin role ID until the token expires. Nothing "
+                             "is cached by default.")
+    parser.add_argument("--cache-ttl", type=int, default=CACHE_TTL,
+                        help="Number of seconds during which the cached "
+                             "projects index remains valid. Defaults to "
+                             "{}.".format(CACHE_TTL))
+    parser.add_argument("--inventory-store", metavar="DB", default=None,
+                        help="SQLite database where to record the resources "
+                             "listed by each run, created if needed.")
+    parser.add_argument("--baseline", metavar="RUN", type=int, default=None,
+                        help="Run of --inventory-store to compare listings "
+                             "with: --dry-run displays the resources new (+) "
+                             "and removed (-) since then, and purging only "
+                             "deletes the resources new since then (the "
+                             "project is then not deleted). Negative values "
+                             "count back from the last run, -1 being the "
+                             "last one.")
+    parser.add_argument("--stored", action="store_true",
+                        help="Display the resources recorded by the "
+                             "--baseline run (the last one by default) of "
+                             "--inventory-store, restricted to the "
+                             "--cleanup-project projects if set, without "
+                             "calling any API.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only list the resources created since the "
+                             "last purge of their type in the project, "
+                             "recorded in --inventory-store. Not every "
+                             "resources type can be listed incrementally.")
+    parser.add_argument("--reconcile-interval", metavar="SECONDS", type=int,
+                        default=RECONCILE_INTERVAL,
+                        help="Number of seconds after which --incremental "
+                             "lists all resources again. Defaults to "
+                             "{}.".format(RECONCILE_INTERVAL))
+    parser.add_argument("--progress", action="store_true",
+                        help="Report the number of resources listed, "
+                             "deleted, being retried and failed by type, "
+                             "with the deletion rate and remaining time "
+                             "(once all are listed), on stderr: every "
+                             "second on a terminal, every "
+                             "{} seconds otherwise.".format(PROGRESS_INTERVAL))
     parser.add_argument("--insecure", action="store_true",
                         help="Explicitly allow all OpenStack clients to perform "
                              "insecure SSL (https) requests. The server's "
@@ -691,15 +2644,491 @@ def parse_args():
                              "used with caution.")
 
     args = parser.parse_args()
-    if not (args.cleanup_project or args.own_project):
-        parser.error('Either --cleanup-project '
-                     'or --own-project has to be set')
-    if args.cleanup_project and args.own_project:
-        parser.error('Both --cleanup-project '
-                     'and --own-project can not be set')
+    if (args.baseline is not None or args.stored) and not args.inventory_store:
+        parser.error('--baseline and --stored require --inventory-store')
+    if args.stored:
+        return args
+    if args.incremental and not args.inventory_store:
+        parser.error('--incremental requires --inventory-store')
+    if args.incremental and args.baseline is not None:
+        parser.error('--incremental can\'t be used with --baseline')
+    if args.inventory_store and (args.sweep_orphans or args.serve or args.fleet):
+        parser.error('--inventory-store requires --cleanup-project or '
+                     '--own-project')
+    # Projects given with --cleanup-project are added to the --fleet worklist
+    modes = [mode for mode in (args.cleanup_project or args.fleet,
+                               args.own_project, args.sweep_orphans,
+                               args.serve) if mode]
+    if not modes:
+        parser.error('Either --cleanup-project, --own-project, '
+                     '--sweep-orphans, --serve or --fleet has to be set')
+    if len(modes) > 1:
+        parser.error('Only one of --cleanup-project (or --fleet), '
+                     '--own-project, --sweep-orphans and --serve can be set')
+    if args.progress and (args.serve or args.fleet):
+        parser.error('--progress can\'t be used with --serve or --fleet')
+    if args.admin_inventory and (args.own_project or args.serve):
+        parser.error('--admin-inventory requires --cleanup-project')
+    if args.summary and args.sweep_orphans:
+        parser.error('--summary can\'t be used with --sweep-orphans')
+    if args.summary:
+        args.dry_run = True
+    load_resources_plugins()
+    try:
+        args.resources = select_resources(
+            args.resources, args.exclude_resources, args.with_dependencies)
+    except ValueError as exc:
+        parser.error(str(exc))
+    args.all_resources = args.resources == set(RESOURCES_REGISTRY)
     return args
 
 
+class ProjectCleanup(object):
+
+    """
+    Performs the action required by args on a project, given by name or
+    ID (or the authentication project if project is None), in three
+    steps that can run from different threads: prepare() (Keystone
+    roles and project state), purge() and teardown(). Each step returns
+    the process exit code. If fresh, the project is fetched from
+    Keystone rather than from the projects index.
+    """
+
+    def __init__(self, keystone_manager, project, args, inventory=None,
+                 store=None, progress=None, fresh=False, aborted=None):
+        self.keystone_manager = keystone_manager
+        self.project = project
+        self.fresh = fresh
+        # Event aborting the purge once set
+        self.aborted = aborted
+        self.args = args
+        self.inventory = inventory
+        self.store = store
+        self.progress = progress
+        self.project_id = None
+        self.remove_admin_role_after_purge = False
+        self.disable_project_after_purge = False
+
+    def prepare(self):
+        keystone_manager = self.keystone_manager
+        try:
+            if self.project is None:
+                self.project_id = keystone_manager.get_project_id()
+            else:
+                tenant = keystone_manager.get_project(self.project,
+                                                      self.fresh)
+                self.project_id = tenant.id
+            if not self.args.own_project:
+                try:
+                    keystone_manager.become_project_admin(self.project_id)
+                except api_exceptions.Conflict:
+                    # user was already admin on the target project.
+                    pass
+                else:
+                    self.remove_admin_role_after_purge = True
+
+                # If the project was enabled before the purge, do not disable it after the purge
+                self.disable_project_after_purge = not tenant.enabled
+                if self.disable_project_after_purge:
+                    # The project is currently disabled so we need to enable it
+                    # in order to delete resources of the project
+                    keystone_manager.enable_project(self.project_id)
+
+        except api_exceptions.Forbidden as exc:
+            print("Not authorized: {}".format(str(exc)))
+            return NOT_AUTHORIZED
+        except NoSuchProject as exc:
+            print("Project {} doesn't exist".format(str(exc)))
+            return NoSuchProject.ERROR_CODE
+        return 0
+
+    def purge(self):
+        args = self.args
+        try:
+            if args.summary:
+                action = "summary"
+            else:
+                action = "dump" if args.dry_run else "purge"
+            # Tokens of other projects are issued after granting the admin
+            # role on them, they can't be reused across runs
+            cache_dir = args.cache_dir if args.own_project else None
+            perform_on_project(args.username, args.password, self.project_id,
+                               args.auth_url, args.endpoint_type, args.region_name,
+                               action, args.insecure, args.resources, self.inventory,
+                               detailed=args.dry_run and args.verbose,
+                               page_size=args.page_size, workers=args.workers,
+                               cache_dir=cache_dir, store=self.store,
+                               baseline=args.baseline,
+                               incremental=args.incremental,
+                               reconcile_interval=args.reconcile_interval,
+                               force_delete=args.force_delete,
+                               progress=self.progress, aborted=self.aborted)
+        except ConnectionError as exc:
+            print("Connection error: {}".format(str(exc)))
+            return CONNECTION_ERROR_CODE
+        except (DeletionFailed, InvalidEndpoint) as exc:
+            print("Deletion of {} failed".format(str(exc)))
+            print("*Warning* Some resources may not have been cleaned up")
+            return DeletionFailed.ERROR_CODE
+        except PurgeAborted as exc:
+            print("Purge of project {} aborted".format(str(exc)))
+            return PurgeAborted.ERROR_CODE
+        return 0
+
+    def teardown(self):
+        args = self.args
+        keystone_manager = self.keystone_manager
+        if (not args.dry_run) and (not args.dont_delete_project) and (not args.own_project) \
+                and args.all_resources and args.baseline is None:
+            keystone_manager.delete_project(self.project_id)
+        else:
+            self.restore()
+        return 0
+
+    def restore(self):
+        """Undoes prepare(), for projects that are not deleted."""
+        keystone_manager = self.keystone_manager
+        # We may want to disable the project, this must happen before
+        # we remove the admin role
+        if self.disable_project_after_purge:
+            keystone_manager.disable_project(self.project_id)
+        # We may also want to remove ourself from the purged project
+        if self.remove_admin_role_after_purge:
+            keystone_manager.undo_become_project_admin(self.project_id)
+
+
+def cleanup_project(keystone_manager, project, args, inventory=None):
+    """
+    Performs the action required by args on a project, given by name or
+    ID (or the authentication project if project is None), fetched from
+    Keystone: keystone_manager may outlive many purges. Returns the
+    process exit code.
+    """
+    cleanup = ProjectCleanup(keystone_manager, project, args, inventory,
+                             fresh=True)
+    return cleanup.prepare() or cleanup.purge() or cleanup.teardown()
+
+
+def cleanup_projects(keystone_manager, projects, args, inventory=None,
+                     store=None, progress=None):
+    """
+    Performs the action required by args on projects, one project after
+    the other. The Keystone preparation of the next projects (up to
+    args.workers of them) and the teardown of the purged ones run
+    concurrently with the current project's purge. Returns the first
+    non zero exit code encountered. If an exception interrupts the
+    batch, the projects prepared but not purged are restored.
+    """
+    cleanups = iter([ProjectCleanup(keystone_manager, project, args, inventory,
+                                    store, progress)
+                     for project in projects])
+    pool = ThreadPool(args.workers)
+    prepared = collections.deque()
+
+    def prepare_next():
+        for cleanup in itertools.islice(cleanups, 1):
+            prepared.append((cleanup, pool.apply_async(cleanup.prepare)))
+
+    # Project whose purge is under way
+    purging = None
+    try:
+        for _ in range(args.workers):
+            prepare_next()
+        exit_code = 0
+        torn_down = []
+        while prepared:
+            cleanup, preparation = prepared.popleft()
+            purging = cleanup
+            prepare_next()
+            code = preparation.get() or cleanup.purge()
+            purging = None
+            if not code:
+                torn_down.append(pool.apply_async(cleanup.teardown))
+            exit_code = exit_code or code
+        for teardown in torn_down:
+            teardown.get()
+        return exit_code
+    except BaseException:
+        # e.g. KeyboardInterrupt, or an unexpected client error
+        unconsumed = [cleanup for cleanup, _ in prepared]
+        if purging is not None:
+            unconsumed.insert(0, purging)
+        for _, preparation in prepared:
+            preparation.wait()
+        for cleanup in unconsumed:
+            try:
+                cleanup.restore()
+            except Exception:
+                logging.exception("Unable to restore project {}".format(
+                    cleanup.project))
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+class Spool(object):
+
+    """
+    Directory of purge requests, consumed by a single daemon. A request
+    is a JSON file named <request>.json, holding {"project": <name or
+    ID>} and optionally {"dry_run": true}. It is claimed by renaming it
+    to <request>.claimed, and its result is written to <request>.result.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def pending(self):
+        """Returns the names of the pending requests, oldest name first."""
+        return sorted(name[:-len('.json')] for name in os.listdir(self.path)
+                      if name.endswith('.json'))
+
+    def recover(self):
+        """Requeues the requests claimed by a daemon that was stopped."""
+        for name in os.listdir(self.path):
+            if name.endswith('.claimed'):
+                os.rename(os.path.join(self.path, name), os.path.join(
+                    self.path, name[:-len('.claimed')] + '.json'))
+
+    def claim(self, name):
+        """
+        Returns the claimed request, or None if it was already claimed
+        or if it is not valid (in which case its result is written).
+        """
+        claimed = os.path.join(self.path, name + '.claimed')
+        try:
+            os.rename(os.path.join(self.path, name + '.json'), claimed)
+        except OSError:
+            return None
+        try:
+            with open(claimed) as request_file:
+                request = json.load(request_file)
+            if not isinstance(request, dict) or 'project' not in request:
+                raise ValueError("no project given")
+        except (IOError, ValueError) as exc:
+            self.complete(name, {'error': "Invalid request: {}".format(exc)})
+            return None
+        return request
+
+    def complete(self, name, result):
+        """Writes the result of a request and removes the request."""
+        result_path = os.path.join(self.path, name + '.result')
+        with open(result_path + '.tmp', 'w') as result_file:
+            json.dump(result, result_file)
+        os.rename(result_path + '.tmp', result_path)
+        os.remove(os.path.join(self.path, name + '.claimed'))
+
+
+def serve(keystone_manager, args, once=False):
+    """
+    Purges the projects requested in the spool directory args.serve,
+    reusing the Keystone authentication across requests. At most
+    args.concurrency projects are purged at a time, and at most
+    args.rate purges are started per minute if set. Runs forever, or
+    until the pending requests are processed if once is True.
+    """
+    spool = Spool(args.serve)
+    spool.recover()
+    slots = threading.BoundedSemaphore(args.concurrency)
+    pool = ThreadPool(args.concurrency)
+    next_start = time.time()
+
+    def process(name, request):
+        try:
+            started = time.time()
+            result = {'project': request['project'], 'started': started}
+            request_args = argparse.Namespace(**vars(args))
+            request_args.dry_run = request.get('dry_run', args.dry_run)
+            try:
+                result['exit_code'] = cleanup_project(
+                    keystone_manager, request['project'], request_args)
+            except Exception as exc:
+                logging.exception("Purge of {} failed".format(
+                    request['project']))
+                result['error'] = str(exc)
+            result['duration'] = time.time() - started
+            spool.complete(name, result)
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            for name in spool.pending():
+                slots.acquire()
+                request = spool.claim(name)
+                if request is None:
+                    slots.release()
+                    continue
+                if args.rate:
+                    # Throttling the purges starts
+                    time.sleep(max(0, next_start - time.time()))
+                    next_start = max(next_start, time.time()) + 60.0 / args.rate
+                logging.info("* Processing request {}".format(name))
+                pool.apply_async(process, (name, request))
+            if once:
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class Worklist(object):
+
+    """
+    SQLite worklist of projects to purge, shared by ospurge processes
+    running on several hosts. A process leases a project before purging
+    it and renews the lease while purging, so that no project is purged
+    by two processes at once. Projects whose lease expired, e.g. because
+    the process purging them died, are leased again by other processes.
+    """
+
+    def __init__(self, path, worker_id=None, lease_duration=LEASE_DURATION):
+        self.path = path
+        self.worker_id = worker_id or "{}:{}".format(socket.gethostname(),
+                                                     os.getpid())
+        self.lease_duration = lease_duration
+        self.execute("CREATE TABLE IF NOT EXISTS projects ("
+                     "project TEXT PRIMARY KEY, state TEXT NOT NULL, "
+                     "owner TEXT, lease_expires REAL, "
+                     "attempts INTEGER NOT NULL DEFAULT 0, exit_code INTEGER)")
+
+    def connect(self):
+        # Transactions are started explicitly
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def execute(self, query, parameters=()):
+        """
+        Executes query in a transaction of its own, returns the number
+        of rows it modified.
+        """
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            rowcount = db.execute(query, parameters).rowcount
+            db.execute("COMMIT")
+            return rowcount
+        finally:
+            db.close()
+
+    def add(self, projects):
+        for project in projects:
+            self.execute("INSERT OR IGNORE INTO projects (project, state) "
+                         "VALUES (?, 'pending')", (project,))
+
+    def lease(self):
+        """Returns a project leased to this worker, None if none is left."""
+        now = time.time()
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT project FROM projects WHERE attempts < ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY rowid LIMIT 1", (LEASE_ATTEMPTS, now)).fetchone()
+            if row:
+                db.execute(
+                    "UPDATE projects SET state = 'leased', owner = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE project = ?",
+                    (self.worker_id, now + self.lease_duration, row[0]))
+            db.execute("COMMIT")
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    def renew(self, project):
+        """Renews the lease on project, returns whether it was still held."""
+        return self.execute(
+            "UPDATE projects SET lease_expires = ? WHERE project = ? "
+            "AND owner = ? AND state = 'leased'",
+            (time.time() + self.lease_duration, project, self.worker_id)) == 1
+
+    def complete(self, project, exit_code):
+        self.execute(
+            "UPDATE projects SET state = ?, exit_code = ? WHERE project = ? "
+            "AND owner = ? AND state = 'leased'",
+            ('done' if exit_code == 0 else 'failed', exit_code, project,
+             self.worker_id))
+
+    def holds(self, project):
+        """
+        Renews the lease on project, returns whether it was still held.
+        A lease that can't be renewed is considered lost.
+        """
+        try:
+            if self.renew(project):
+                return True
+        except sqlite3.Error as exc:
+            logging.warning("Unable to renew the lease on project {}: "
+                            "{}".format(project, exc))
+        logging.warning("Lease on project {} lost".format(project))
+        return False
+
+    def heartbeat(self, project, stop, lost):
+        """Renews the lease on project until stop is set, or sets lost."""
+        while not stop.wait(self.lease_duration / 3.0):
+            if not self.holds(project):
+                lost.set()
+                return
+
+
+def purge_worklist(keystone_manager, worklist, args):
+    """
+    Performs the action required by args on the projects of worklist,
+    until none is left to lease. The purge of a project is aborted as
+    soon as its lease is lost, and the project is torn down (e.g.
+    deleted) only if the lease is still held. Returns the first non
+    zero exit code encountered.
+    """
+    exit_code = 0
+    while True:
+        project = worklist.lease()
+        if project is None:
+            return exit_code
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=worklist.heartbeat,
+                                     args=(project, stop, lost))
+        heartbeat.daemon = True
+        heartbeat.start()
+        cleanup = ProjectCleanup(keystone_manager, project, args, fresh=True,
+                                 aborted=lost)
+        try:
+            code = cleanup.prepare() or cleanup.purge()
+            if not code and (lost.is_set() or not worklist.holds(project)):
+                # Another process may be purging the project by now
+                print("Purge of project {} aborted".format(project))
+                code = PurgeAborted.ERROR_CODE
+            code = code or cleanup.teardown()
+        finally:
+            stop.set()
+            heartbeat.join()
+        worklist.complete(project, code)
+        exit_code = exit_code or code
+
+
+def display_stored(store, run, projects=None):
+    """
+    Prints the resources recorded by run of store, by project and
+    resources class, for the projects given by name or ID if set.
+    """
+    current = None
+    for project in projects or [None]:
+        for project_id, resources_class, ref in store.query(run, project):
+            if (project_id, resources_class) != current:
+                if current is not None:
+                    print("")
+                if current is None or current[0] != project_id:
+                    print("* Project: {}".format(project_id))
+                print("* Resources type: {}".format(resources_class))
+                current = (project_id, resources_class)
+            print("{} {} (id {})".format(ref.type, ref.name, ref.id))
+    if current is not None:
+        print("")
+
+
 def main():
     args = parse_args()
 
@@ -709,67 +3138,76 @@ def main():
         # Set default log level to Warning
         logging.basicConfig(level=logging.WARNING)
 
+    store = None
+    if args.inventory_store:
+        store = InventoryStore(args.inventory_store)
+        if args.baseline is not None and args.baseline < 0:
+            args.baseline = store.last_run() + 1 + args.baseline
+        if args.stored:
+            display_stored(store, args.baseline or store.last_run(),
+                           args.cleanup_project)
+            sys.exit(0)
+        store.start_run()
+
     try:
         keystone_manager = KeystoneManager(args.username, args.password,
                                            args.admin_project, args.auth_url,
-                                           args.insecure, region_name=args.region_name)
+                                           args.insecure, cache_dir=args.cache_dir,
+                                           cache_ttl=args.cache_ttl,
+                                           region_name=args.region_name)
     except api_exceptions.Unauthorized as exc:
         print("Authentication failed: {}".format(str(exc)))
         sys.exit(AUTHENTICATION_FAILED_ERROR_CODE)
 
-    remove_admin_role_after_purge = False
-    disable_project_after_purge = False
-    try:
-        cleanup_project_id = keystone_manager.get_project_id(
-            args.cleanup_project)
-        if not args.own_project:
-            try:
-                keystone_manager.become_project_admin(cleanup_project_id)
-            except api_exceptions.Conflict:
-                # user was already admin on the target project.
-                pass
-            else:
-                remove_admin_role_after_purge = True
-
-            # If the project was enabled before the purge, do not disable it after the purge
-            disable_project_after_purge = not keystone_manager.tenant_info.enabled
-            if disable_project_after_purge:
-                # The project is currently disabled so we need to enable it
-                # in order to delete resources of the project
-                keystone_manager.enable_project(cleanup_project_id)
-
-    except api_exceptions.Forbidden as exc:
-        print("Not authorized: {}".format(str(exc)))
-        sys.exit(NOT_AUTHORIZED)
-    except NoSuchProject as exc:
-        print("Project {} doesn't exist".format(str(exc)))
-        sys.exit(NoSuchProject.ERROR_CODE)
-
-    # Proper cleanup
-    try:
+    progress = None
+    if args.progress:
+        progress = Progress()
+        progress.start()
+
+    if args.sweep_orphans:
         action = "dump" if args.dry_run else "purge"
-        perform_on_project(args.username, args.password, cleanup_project_id,
-                           args.auth_url, args.endpoint_type, args.region_name,
-                           action, args.insecure)
-    except ConnectionError as exc:
-        print("Connection error: {}".format(str(exc)))
-        sys.exit(CONNECTION_ERROR_CODE)
-    except (DeletionFailed, InvalidEndpoint) as exc:
-        print("Deletion of {} failed".format(str(exc)))
-        print("*Warning* Some resources may not have been cleaned up")
-        sys.exit(DeletionFailed.ERROR_CODE)
-
-    if (not args.dry_run) and (not args.dont_delete_project) and (not args.own_project):
-        keystone_manager.delete_project(cleanup_project_id)
-    else:
-        # Project is not deleted, we may want to disable the project
-        # this must happen before we remove the admin role
-        if disable_project_after_purge:
-            keystone_manager.disable_project(cleanup_project_id)
-        # We may also want to remove ourself from the purged project
-        if remove_admin_role_after_purge:
-            keystone_manager.undo_become_project_admin(cleanup_project_id)
-    sys.exit(0)
+        try:
+            sweep_orphans(args.username, args.password,
+                          keystone_manager.get_project_id(), args.auth_url,
+                          keystone_manager.orphan_filter(), args.endpoint_type,
+                          args.region_name, action, args.insecure,
+                          args.resources, args.workers, args.page_size,
+                          args.cache_dir, progress, args.force_delete)
+        except api_exceptions.Forbidden as exc:
+            print("Not authorized: {}".format(str(exc)))
+            sys.exit(NOT_AUTHORIZED)
+        except ConnectionError as exc:
+            print("Connection error: {}".format(str(exc)))
+            sys.exit(CONNECTION_ERROR_CODE)
+        except DeletionFailed as exc:
+            print("Deletion of {} failed".format(str(exc)))
+            print("*Warning* Some resources may not have been cleaned up")
+            sys.exit(DeletionFailed.ERROR_CODE)
+        finally:
+            if progress is not None:
+                progress.stop()
+        sys.exit(0)
+
+    if args.serve:
+        serve(keystone_manager, args)
+        sys.exit(0)
+
+    if args.fleet:
+        worklist = Worklist(args.fleet)
+        worklist.add(args.cleanup_project or [])
+        sys.exit(purge_worklist(keystone_manager, worklist, args))
+
+    inventory = AdminInventory() if args.admin_inventory else None
+    # When purging several projects, carry on with the next projects
+    # and exit with the first error code encountered.
+    try:
+        exit_code = cleanup_projects(keystone_manager,
+                                     args.cleanup_project or [None], args,
+                                     inventory, store, progress)
+    finally:
+        if progress is not None:
+            progress.stop()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
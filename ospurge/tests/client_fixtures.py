@@ -20,23 +20,29 @@ USER_ID = 'c4da488862bd435c9e6c0275a0d0e49a'
 PROJECT_ID = '225da22d3ce34b15877ea70b2a575f58'
 
 VOLUME_PUBLIC_ENDPOINT = 'http://public:8776/v1/225da22d3ce34b15877ea70b2a575f58'
+VOLUME_V3_PUBLIC_ENDPOINT = 'http://public:8776/v3/225da22d3ce34b15877ea70b2a575f58'
 IMAGE_PUBLIC_ENDPOINT = 'http://public:9292'
 STORAGE_PUBLIC_ENDPOINT = 'http://public:8080/v1/AUTH_ee5b90900a4b4e85938b0ceadf4467f8'
 NETWORK_PUBLIC_ENDPOINT = 'https://network0.cw-labs.net'
 COMPUTE_PUBLIC_ENDPOINT = 'https://compute0.cw-labs.net/v2/43c9e28327094e1b81484f4b9aee74d5'
 METERING_PUBLIC_ENDPOINT = 'https://metric0.cw-labs.net'
+ORCHESTRATION_PUBLIC_ENDPOINT = 'http://public:8004/v1/225da22d3ce34b15877ea70b2a575f58'
 VOLUME_INTERNAL_ENDPOINT = 'http://internal:8776/v1/225da22d3ce34b15877ea70b2a575f58'
 IMAGE_INTERNAL_ENDPOINT = 'http://internal:9292'
 STORAGE_INTERNAL_ENDPOINT = 'http://internal:8080/v1/AUTH_ee5b90900a4b4e85938b0ceadf4467f8'
 NETWORK_INTERNAL_ENDPOINT = 'http://neutron.usr.lab0.aub.cw-labs.net:9696'
 COMPUTE_INTERNAL_ENDPOINT = 'http://nova.usr.lab0.aub.cw-labs.net:8774/v2/43c9e28327094e1b81484f4b9aee74d5'
 METERING_INTERNAL_ENDPOINT = 'http://ceilometer.usr.lab0.aub.cw-labs.net:8777'
+ORCHESTRATION_INTERNAL_ENDPOINT = 'http://internal:8004/v1/225da22d3ce34b15877ea70b2a575f58'
 
 
 STORAGE_CONTAINERS = ['janeausten', 'marktwain']
 STORAGE_OBJECTS = [{'container': 'janeausten', 'name': 'foo'},
                    {'container': 'janeausten', 'name': 'bar'},
                    {'container': 'marktwain', 'name': 'hello world'}]
+STORAGE_SLO = {'container': 'backups', 'name': 'disk.img'}
+STORAGE_SLO_SEGMENTS = [{'container': 'backups_segments', 'name': 'disk.img/000'},
+                        {'container': 'backups_segments', 'name': 'disk.img/001'}]
 
 VOLUMES_IDS = ["45baf976-c20a-4894-a7c3-c94b7376bf55",
                "5aa119a8-d25b-45a7-8d1b-88e127885635"]
@@ -54,6 +60,7 @@ SERVERS_IDS = ["616fb98f-46ca-475e-917e-2563e5a8cd19"]
 IMAGES_IDS = ["37717f53-3707-49b9-9dd0-fd063e6b9fc5", "4e150966-cbe7-4fd7-a964-41e008d20f10",
               "482fbcc3-d831-411d-a073-ddc828a7a9ed"]
 ALARMS_IDS = ["ca950223-e982-4552-9dec-5dc5d3ea4172"]
+STACKS_IDS = ["3095aefc-09fb-4bc7-b1f0-f21a304e864c"]
 UNBOUND_PORT_ID = "abcdb45e-45fe-4e04-8704-bf6f58760000"
 
 # Simulating JSON sent from the Server
@@ -133,6 +140,15 @@ PROJECT_SCOPED_TOKEN = {
             'endpoints_links': [],
             'name': 'Metering service',
             'type': 'metering'
+        }, {
+            'endpoints': [{
+                'adminURL': 'http://admin:8004/v1/225da22d3ce34b15877ea70b2a575f58',
+                'internalURL': ORCHESTRATION_INTERNAL_ENDPOINT,
+                'publicURL': ORCHESTRATION_PUBLIC_ENDPOINT,
+                'region': 'RegionOne'}],
+            'endpoints_links': [],
+            'name': 'Orchestration Service',
+            'type': 'orchestration'
         }],
         'token': {
             'expires': '2012-10-03T16:53:36Z',
@@ -156,6 +172,36 @@ PROJECT_SCOPED_TOKEN = {
     }
 }
 
+IDENTITY_ADMIN_ENDPOINT = 'http://admin:35357/v2.0'
+
+TENANTS_LIST = {
+    "tenants": [
+        {
+            "id": PROJECT_ID,
+            "name": "demo",
+            "description": "Demo project",
+            "enabled": True
+        },
+        {
+            "id": "c2a5a1ef9d8e4e2a9b3cbb2d3a3c1b8f",
+            "name": "purged",
+            "description": "Project to purge",
+            "enabled": False
+        }
+    ]
+}
+
+
+ADMIN_ROLE_ID = "9fe2ff9ee4384b1894a90878d3e92bab"
+
+ROLES_LIST = {
+    "roles": [
+        {"id": "2a3a7d6b3c0d4e1ba51e5e6f7d3c5f6a", "name": "_member_"},
+        {"id": ADMIN_ROLE_ID, "name": "admin"}
+    ]
+}
+
+
 STORAGE_CONTAINERS_LIST = [
     {
         "count": 0,
@@ -198,6 +244,36 @@ STORAGE_OBJECTS_LIST_1 = [
 ]
 
 
+STORAGE_SLO_LIST = [
+    {
+        "hash": "f1c9645dbc14efddc7d8a322685f26eb",
+        "last_modified": "2014-01-15T16:45:12.120860",
+        "bytes": 2097152,
+        "name": STORAGE_SLO['name'],
+        "content_type": "application/octet-stream",
+        "slo_etag": "\"8f481cede6d2ddc07cb36aa084d9a64d\""
+    }
+]
+
+
+STORAGE_SLO_MANIFEST = [
+    {
+        "name": "/{container}/{name}".format(**segment),
+        "bytes": 1048576,
+        "hash": "b6d81b360a5672d80c27430f39153e2c",
+        "content_type": "application/octet-stream",
+        "last_modified": "2014-01-15T16:44:58.210910"
+    } for segment in STORAGE_SLO_SEGMENTS
+]
+
+
+STORAGE_ACCOUNT_HEADERS = {
+    "x-account-container-count": "2",
+    "x-account-object-count": "3",
+    "x-account-bytes-used": "40"
+}
+
+
 VOLUMES_LIST = {
     "volumes": [
         {
@@ -611,6 +687,17 @@ FLOATING_IPS_LIST = {
 }
 
 
+COMPUTE_LIMITS = {
+    "limits": {
+        "rate": [],
+        "absolute": {
+            "maxTotalInstances": 10,
+            "totalInstancesUsed": 4
+        }
+    }
+}
+
+
 SERVERS_LIST = {
     "servers": [
         {
@@ -668,69 +755,76 @@ SERVERS_LIST = {
     ]
 }
 
+IMAGE_SCHEMA = {
+    "name": "image",
+    "properties": {
+        "checksum": {"type": ["null", "string"]},
+        "container_format": {"type": ["null", "string"]},
+        "created_at": {"type": "string"},
+        "disk_format": {"type": ["null", "string"]},
+        "file": {"type": "string"},
+        "id": {"type": "string"},
+        "min_disk": {"type": "integer"},
+        "min_ram": {"type": "integer"},
+        "name": {"type": ["null", "string"]},
+        "owner": {"type": ["null", "string"]},
+        "protected": {"type": "boolean"},
+        "schema": {"type": "string"},
+        "self": {"type": "string"},
+        "size": {"type": ["null", "integer"]},
+        "status": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "updated_at": {"type": "string"},
+        "visibility": {"type": "string", "enum": ["public", "private"]}
+    },
+    "additionalProperties": {"type": "string"},
+    "links": [
+        {"href": "{self}", "rel": "self"},
+        {"href": "{file}", "rel": "enclosure"},
+        {"href": "{schema}", "rel": "describedby"}
+    ]
+}
+
+
+def _image(image_id, name, created_at, protected=False, **properties):
+    image = {
+        "checksum": "f8a2eeee2dc65b3d9b6e63678955bd83",
+        "container_format": "ami",
+        "created_at": created_at,
+        "disk_format": "ami",
+        "file": "/v2/images/{}/file".format(image_id),
+        "id": image_id,
+        "min_disk": 0,
+        "min_ram": 0,
+        "name": name,
+        "owner": PROJECT_ID,
+        "protected": protected,
+        "schema": "/v2/schemas/image",
+        "self": "/v2/images/{}".format(image_id),
+        "size": 25165824,
+        "status": "active",
+        "tags": [],
+        "updated_at": created_at,
+        "visibility": "public"
+    }
+    image.update(properties)
+    return image
+
+
 IMAGES_LIST = {
     "images": [
-        {
-            "checksum": "f8a2eeee2dc65b3d9b6e63678955bd83",
-            "container_format": "ami",
-            "created_at": "2014-02-03T14:13:53",
-            "deleted": False,
-            "deleted_at": None,
-            "disk_format": "ami",
-            "id": "37717f53-3707-49b9-9dd0-fd063e6b9fc5",
-            "is_public": True,
-            "min_disk": 0,
-            "min_ram": 0,
-            "name": "cirros-0.3.1-x86_64-uec",
-            "owner": PROJECT_ID,
-            "properties": {
-                "kernel_id": "4e150966-cbe7-4fd7-a964-41e008d20f10",
-                "ramdisk_id": "482fbcc3-d831-411d-a073-ddc828a7a9ed"
-            },
-            "protected": False,
-            "size": 25165824,
-            "status": "active",
-            "updated_at": "2014-02-03T14:13:54"
-        },
-        {
-            "checksum": "c352f4e7121c6eae958bc1570324f17e",
-            "container_format": "aki",
-            "created_at": "2014-02-03T14:13:52",
-            "deleted": False,
-            "deleted_at": None,
-            "disk_format": "aki",
-            "id": "4e150966-cbe7-4fd7-a964-41e008d20f10",
-            "is_public": True,
-            "min_disk": 0,
-            "min_ram": 0,
-            "name": "cirros-0.3.1-x86_64-uec-kernel",
-            "owner": PROJECT_ID,
-            "properties": {},
-            "protected": False,
-            "size": 4955792,
-            "status": "active",
-            "updated_at": "2014-02-03T14:13:52"
-        },
-        {
-            "checksum": "69c33642f44ca552ba4bb8b66ad97e85",
-            "container_format": "ari",
-            "created_at": "2014-02-03T14:13:53",
-            "deleted": False,
-            "deleted_at": None,
-            "disk_format": "ari",
-            "id": "482fbcc3-d831-411d-a073-ddc828a7a9ed",
-            "is_public": True,
-            "min_disk": 0,
-            "min_ram": 0,
-            "name": "cirros-0.3.1-x86_64-uec-ramdisk",
-            "owner": PROJECT_ID,
-            "properties": {},
-            "protected": False,
-            "size": 3714968,
-            "status": "active",
-            "updated_at": "2014-02-03T14:13:53"
-        }
-    ]
+        _image(IMAGES_IDS[0], "cirros-0.3.1-x86_64-uec",
+               "2014-02-03T14:13:53Z", protected=True,
+               kernel_id=IMAGES_IDS[1], ramdisk_id=IMAGES_IDS[2]),
+        _image(IMAGES_IDS[1], "cirros-0.3.1-x86_64-uec-kernel",
+               "2014-02-03T14:13:52Z", container_format="aki",
+               disk_format="aki"),
+        _image(IMAGES_IDS[2], "cirros-0.3.1-x86_64-uec-ramdisk",
+               "2014-02-03T14:13:53Z", container_format="ari",
+               disk_format="ari")
+    ],
+    "schema": "/v2/schemas/images",
+    "first": "/v2/images"
 }
 
 ALARMS_LIST = [
@@ -759,3 +853,24 @@ ALARMS_LIST = [
         "user_id": "c96c887c216949acbdfbd8b494863567"
     }
 ]
+
+STACKS_LIST = {
+    "stacks": [
+        {
+            "creation_time": "2014-06-03T20:59:46Z",
+            "description": "sample stack",
+            "id": STACKS_IDS[0],
+            "links": [
+                {
+                    "href": "http://public:8004/v1/225da22d3ce34b15877ea70b2a575f58/stacks/simple_stack/3095aefc-09fb-4bc7-b1f0-f21a304e864c",
+                    "rel": "self"
+                }
+            ],
+            "project": PROJECT_ID,
+            "stack_name": "simple_stack",
+            "stack_status": "CREATE_COMPLETE",
+            "stack_status_reason": "Stack CREATE completed successfully",
+            "updated_time": ""
+        }
+    ]
+}
@@ -23,10 +23,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import argparse
+import copy
 import itertools
 import json as jsonutils
+import os
+import stat
+import threading
 
+import fixtures
+import glanceclient.exc
 import httpretty
+import novaclient.exceptions
+from six.moves import StringIO
 import testtools
 
 import client_fixtures
@@ -45,6 +54,9 @@ class HttpTest(testtools.TestCase):
             base_url = self.TEST_URL
         if json is not None:
             kwargs['body'] = jsonutils.dumps(json)
+            if method == 'GET':
+                kwargs['body'] = self.first_page(json,
+                                                 kwargs.pop('status', 200))
             kwargs['content_type'] = 'application/json'
         if parts:
             url = '/'.join([p.strip('/') for p in [base_url] + parts])
@@ -52,6 +64,22 @@ class HttpTest(testtools.TestCase):
             url = base_url
         httpretty.register_uri(method, url, **kwargs)
 
+    @staticmethod
+    def first_page(json, status=200):
+        """
+        Returns a body callback serving json as the only page of a
+        listing: the pages following a marker are empty.
+        """
+        def body(request, uri, headers):
+            if 'marker' not in request.querystring:
+                return status, headers, jsonutils.dumps(json)
+            if isinstance(json, list):
+                return status, headers, '[]'
+            return status, headers, jsonutils.dumps(dict(
+                (key, [] if isinstance(value, list) else value)
+                for key, value in json.items()))
+        return body
+
     def stub_auth(self):
         self.stub_url('POST', parts=['tokens'], base_url=AUTH_URL,
                       json=client_fixtures.PROJECT_SCOPED_TOKEN)
@@ -88,6 +116,771 @@ class SessionTest(HttpTest):
         endpoint = session.get_endpoint('image')
         self.assertEqual(endpoint, client_fixtures.IMAGE_INTERNAL_ENDPOINT)
 
+    @httpretty.activate
+    def test_has_service(self):
+        self.stub_auth()
+        session = ospurge.Session(USERNAME, PASSWORD,
+                                  client_fixtures.PROJECT_ID, AUTH_URL)
+        self.assertTrue(session.has_service('volume'))
+        self.assertFalse(session.has_service('database'))
+
+
+class KeystoneManagerTest(HttpTest):
+    TEST_URL = client_fixtures.IDENTITY_ADMIN_ENDPOINT
+
+    def setUp(self):
+        super(KeystoneManagerTest, self).setUp()
+        self.cache_dir = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                      'cache')
+        self.patch(ospurge, 'PASSWORD_ITERATIONS', 1000)
+
+    def keystone_manager(self):
+        self.stub_auth()
+        self.stub_url('GET', parts=['tenants'],
+                      json=client_fixtures.TENANTS_LIST)
+        for tenant in client_fixtures.TENANTS_LIST['tenants']:
+            self.stub_url('GET', parts=['tenants', tenant['id']],
+                          json={'tenant': tenant})
+        return ospurge.KeystoneManager(USERNAME, PASSWORD, 'demo', AUTH_URL,
+                                       False, cache_dir=self.cache_dir)
+
+    def tenants_requests(self):
+        return [req for req in httpretty.HTTPretty.latest_requests
+                if req.path.startswith('/v2.0/tenants')]
+
+    @httpretty.activate
+    def test_get_project_id(self):
+        keystone_manager = self.keystone_manager()
+        for tenant in client_fixtures.TENANTS_LIST['tenants']:
+            self.assertEqual(tenant['id'],
+                             keystone_manager.get_project_id(tenant['name']))
+            self.assertEqual(tenant['id'],
+                             keystone_manager.get_project_id(tenant['id']))
+        self.assertEqual(1, len(self.tenants_requests()))
+        self.assertFalse(keystone_manager.tenant_info.enabled)
+        self.stub_url('GET', parts=['tenants', 'unknown'], status=404,
+                      json={'error': {'code': 404, 'title': 'Not Found',
+                                      'message': 'Not Found'}})
+        self.assertRaises(ospurge.NoSuchProject,
+                          keystone_manager.get_project_id, 'unknown')
+
+    @httpretty.activate
+    def test_projects_cache(self):
+        self.keystone_manager().get_project_id('demo')
+        cache = os.path.join(self.cache_dir, 'projects.json')
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(cache).st_mode))
+        httpretty.reset()
+        project_id = self.keystone_manager().get_project_id('purged')
+        self.assertEqual('c2a5a1ef9d8e4e2a9b3cbb2d3a3c1b8f', project_id)
+        self.assertEqual(['/v2.0/tenants/' + project_id],
+                         [req.path for req in self.tenants_requests()])
+
+    @httpretty.activate
+    def test_projects_cache_renamed(self):
+        # Cached before the projects were renamed
+        ospurge.save_cache(os.path.join(self.cache_dir, 'projects.json'),
+                           {'auth_url': AUTH_URL, 'project_ids': {
+                               'demo': 'c2a5a1ef9d8e4e2a9b3cbb2d3a3c1b8f'}})
+        project_id = self.keystone_manager().get_project_id('demo')
+        self.assertEqual(client_fixtures.PROJECT_ID, project_id)
+        # The cached index was rebuilt
+        self.assertEqual(['/v2.0/tenants/c2a5a1ef9d8e4e2a9b3cbb2d3a3c1b8f',
+                          '/v2.0/tenants'],
+                         [req.path for req in self.tenants_requests()])
+
+    @httpretty.activate
+    def test_auth_cache(self):
+        token = copy.deepcopy(client_fixtures.PROJECT_SCOPED_TOKEN)
+        token['access']['token']['expires'] = '2100-01-01T00:00:00Z'
+        self.stub_url('POST', parts=['tokens'], base_url=AUTH_URL, json=token)
+        self.stub_url('GET', parts=['OS-KSADM', 'roles'],
+                      json=client_fixtures.ROLES_LIST)
+        for _ in range(2):
+            keystone_manager = ospurge.KeystoneManager(
+                USERNAME, PASSWORD, 'demo', AUTH_URL, False,
+                cache_dir=self.cache_dir)
+            self.assertEqual(client_fixtures.ADMIN_ROLE_ID,
+                             keystone_manager.get_admin_role_id())
+        self.assertEqual(client_fixtures.TOKEN_ID,
+                         keystone_manager.client.auth_token)
+        requests = [req.path for req in httpretty.HTTPretty.latest_requests]
+        self.assertEqual(['/v2.0/tokens', '/v2.0/OS-KSADM/roles'], requests)
+        cache, = os.listdir(self.cache_dir)
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(
+            os.path.join(self.cache_dir, cache)).st_mode))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.cache_dir).st_mode))
+        # The password can't be told from the cache name, nor its content
+        self.assertEqual(cache, ospurge.AuthCache(
+            self.cache_dir, username=USERNAME, password='other',
+            tenant_name='demo', auth_url=AUTH_URL,
+            insecure=False).path.split('/')[-1])
+        with open(os.path.join(self.cache_dir, cache)) as cache_file:
+            self.assertNotIn(PASSWORD, cache_file.read())
+
+    @httpretty.activate
+    def test_auth_cache_other_password(self):
+        token = copy.deepcopy(client_fixtures.PROJECT_SCOPED_TOKEN)
+        token['access']['token']['expires'] = '2100-01-01T00:00:00Z'
+        self.stub_url('POST', parts=['tokens'], base_url=AUTH_URL, json=token)
+        for password in (PASSWORD, 'other', 'other'):
+            ospurge.KeystoneManager(USERNAME, password, 'demo', AUTH_URL,
+                                    False, cache_dir=self.cache_dir)
+        # The cached token isn't used with another password, which is
+        # authenticated, and then cached in turn
+        passwords = [jsonutils.loads(req.body)['auth']['passwordCredentials'][
+            'password'] for req in httpretty.HTTPretty.latest_requests]
+        self.assertEqual([PASSWORD, 'other'], passwords)
+
+
+class ResourcesClassesTest(testtools.TestCase):
+
+    def test_builtin_order(self):
+        classes = ospurge.resources_classes(ospurge.RESOURCES_CLASSES)
+        self.assertEqual(ospurge.RESOURCES_CLASSES,
+                         [cls.__name__ for cls in classes])
+
+    def test_load_plugins(self):
+        class Plugin(ospurge.Resources):
+            pass
+
+        class EntryPoint(object):
+            def __init__(self, name):
+                self.name = name
+
+            def load(self):
+                return Plugin
+        self.patch(ospurge.pkg_resources, 'iter_entry_points',
+                   lambda group: [EntryPoint('NovaServers'),
+                                  EntryPoint('Plugin')])
+        self.addCleanup(ospurge.RESOURCES_REGISTRY.pop, 'Plugin')
+        novaservers = ospurge.RESOURCES_REGISTRY['NovaServers']
+        ospurge.load_resources_plugins()
+        self.assertIs(Plugin, ospurge.RESOURCES_REGISTRY['Plugin'])
+        # Built-in classes aren't replaced, e.g. by another copy of them
+        self.assertIs(novaservers, ospurge.RESOURCES_REGISTRY['NovaServers'])
+
+    def test_plugin_after_dependencies(self):
+        class Plugin(ospurge.Resources):
+            DEPENDS_ON = ('CinderVolumes',)
+        self.addCleanup(ospurge.RESOURCES_REGISTRY.pop, 'Plugin')
+        ospurge.register_resources_class(Plugin)
+        names = [cls.__name__ for cls in ospurge.resources_classes(
+            ['Plugin', 'CinderVolumes', 'CinderSnapshots'])]
+        self.assertEqual(['CinderSnapshots', 'CinderVolumes', 'Plugin'],
+                         names)
+
+    def test_circular_dependency(self):
+        class Plugin(ospurge.Resources):
+            DEPENDS_ON = ('Plugin',)
+        self.addCleanup(ospurge.RESOURCES_REGISTRY.pop, 'Plugin')
+        ospurge.register_resources_class(Plugin)
+        self.assertRaises(ValueError, ospurge.resources_classes, ['Plugin'])
+
+    def test_select_prefix(self):
+        self.assertEqual(set(['SwiftObjects', 'SwiftContainers']),
+                         ospurge.select_resources(['swift']))
+
+    def test_select_exclude(self):
+        selected = ospurge.select_resources(exclude=['Neutron', 'Swift'])
+        self.assertIn('NovaServers', selected)
+        self.assertNotIn('NeutronPorts', selected)
+        self.assertNotIn('SwiftObjects', selected)
+
+    def test_select_with_dependencies(self):
+        self.assertEqual(set(['NeutronRouters', 'NeutronInterfaces',
+                              'NeutronFloatingIps']),
+                         ospurge.select_resources(['NeutronRouters'],
+                                                  with_dependencies=True))
+
+    def test_select_unknown(self):
+        self.assertRaises(ValueError, ospurge.select_resources, ['Foo'])
+
+
+class CleanupProjectsTest(testtools.TestCase):
+
+    def setUp(self):
+        super(CleanupProjectsTest, self).setUp()
+        self.events = []
+        self.p2_prepared = threading.Event()
+        self.interrupted = None
+        test = self
+
+        class FakeCleanup(object):
+            def __init__(self, keystone_manager, project, args, inventory,
+                         store, progress):
+                self.project = project
+
+            def prepare(self):
+                test.events.append(('prepare', self.project))
+                if self.project == 'p2':
+                    test.p2_prepared.set()
+                    return ospurge.NOT_AUTHORIZED
+                return 0
+
+            def purge(self):
+                if self.project == 'p1':
+                    # p2 is prepared while p1 is purged
+                    test.assertTrue(test.p2_prepared.wait(5))
+                if self.project == test.interrupted:
+                    raise KeyboardInterrupt()
+                test.events.append(('purge', self.project))
+                return 0
+
+            def teardown(self):
+                test.events.append(('teardown', self.project))
+                return 0
+
+            def restore(self):
+                test.events.append(('restore', self.project))
+        self.patch(ospurge, 'ProjectCleanup', FakeCleanup)
+
+    def test_cleanup_projects(self):
+        args = argparse.Namespace(workers=2)
+        code = ospurge.cleanup_projects(None, ['p1', 'p2', 'p3'], args)
+        self.assertEqual(ospurge.NOT_AUTHORIZED, code)
+        purges = [project for event, project in self.events
+                  if event == 'purge']
+        self.assertEqual(['p1', 'p3'], purges)
+        self.assertEqual(set(['p1', 'p3']),
+                         set(project for event, project in self.events
+                             if event == 'teardown'))
+
+    def test_interrupted(self):
+        self.interrupted = 'p1'
+        args = argparse.Namespace(workers=2)
+        self.assertRaises(KeyboardInterrupt, ospurge.cleanup_projects, None,
+                          ['p1', 'p2', 'p3', 'p4'], args)
+        # Projects prepared are restored, the others are left untouched
+        self.assertEqual(set(['p1', 'p2', 'p3']),
+                         set(project for event, project in self.events
+                             if event == 'prepare'))
+        self.assertEqual(['p1', 'p2', 'p3'],
+                         [project for event, project in self.events
+                          if event == 'restore'])
+
+
+class ServeTest(testtools.TestCase):
+
+    def setUp(self):
+        super(ServeTest, self).setUp()
+        self.spool = self.useFixture(fixtures.TempDir()).path
+        self.args = argparse.Namespace(serve=self.spool, concurrency=2,
+                                       rate=None, dry_run=False)
+        self.purged = []
+
+        def cleanup_project(keystone_manager, project, args):
+            if project == 'broken':
+                raise Exception('Connection lost')
+            self.purged.append((project, args.dry_run))
+            return 0
+        self.patch(ospurge, 'cleanup_project', cleanup_project)
+
+    def request(self, name, content):
+        with open(os.path.join(self.spool, name), 'w') as request:
+            request.write(content)
+
+    def result(self, name):
+        with open(os.path.join(self.spool, name + '.result')) as result:
+            return jsonutils.load(result)
+
+    def test_serve(self):
+        self.request('1.json', '{"project": "p1"}')
+        self.request('2.json', '{"project": "p2", "dry_run": true}')
+        self.request('3.json', '{"project": "broken"}')
+        self.request('4.json', 'not json')
+        # Claimed by a daemon that was stopped
+        self.request('5.claimed', '{"project": "p5"}')
+        ospurge.serve(None, self.args, once=True)
+        self.assertEqual(set([('p1', False), ('p2', True), ('p5', False)]),
+                         set(self.purged))
+        self.assertEqual(0, self.result('1')['exit_code'])
+        self.assertEqual('Connection lost', self.result('3')['error'])
+        self.assertTrue(self.result('4')['error'].startswith('Invalid request'))
+        self.assertEqual(['1.result', '2.result', '3.result', '4.result',
+                          '5.result'], sorted(os.listdir(self.spool)))
+
+
+class ServeCloudTest(HttpTest):
+
+    """Serves requests against a stand-in cloud of Keystone and Neutron."""
+
+    TEST_URL = client_fixtures.IDENTITY_ADMIN_ENDPOINT
+
+    def setUp(self):
+        super(ServeCloudTest, self).setUp()
+        self.spool = self.useFixture(fixtures.TempDir()).path
+        self.args = argparse.Namespace(
+            serve=self.spool, concurrency=1, rate=None, dry_run=False,
+            summary=False, verbose=False, own_project=False,
+            dont_delete_project=False, username=USERNAME, password=PASSWORD,
+            auth_url=AUTH_URL, endpoint_type='publicURL', region_name=None,
+            insecure=False, resources=set(['NeutronRouters']),
+            all_resources=False, page_size=ospurge.PAGE_SIZE,
+            workers=ospurge.WORKERS, cache_dir=None, baseline=None,
+            incremental=False, reconcile_interval=ospurge.RECONCILE_INTERVAL,
+            force_delete=False)
+        self.patch(ospurge.sys, 'stdout', StringIO())
+
+    def stub_tenants(self, tenants):
+        self.stub_url('GET', parts=['tenants'], json={'tenants': tenants})
+        for tenant in tenants:
+            self.stub_url('GET', parts=['tenants', tenant['id']],
+                          json={'tenant': tenant})
+            self.stub_url('POST', parts=['tenants', tenant['id']],
+                          json={'tenant': tenant})
+            for method in ('PUT', 'DELETE'):
+                self.stub_url(method, parts=[
+                    'tenants', tenant['id'], 'users', client_fixtures.USER_ID,
+                    'roles', 'OS-KSADM', client_fixtures.ADMIN_ROLE_ID],
+                    json={'role': {'id': client_fixtures.ADMIN_ROLE_ID,
+                                   'name': 'admin'}})
+
+    def stub_cloud(self):
+        self.stub_auth()
+        self.stub_tenants(client_fixtures.TENANTS_LIST['tenants'])
+        self.stub_url('GET', parts=['OS-KSADM', 'roles'],
+                      json=client_fixtures.ROLES_LIST)
+        network = client_fixtures.NETWORK_PUBLIC_ENDPOINT
+        self.stub_url('GET', parts=['v2.0', 'routers.json'], base_url=network,
+                      json=client_fixtures.ROUTERS_LIST)
+        for router_id in client_fixtures.ROUTERS_IDS:
+            for method in ('PUT', 'DELETE'):
+                self.stub_url(method, base_url=network, json={}, parts=[
+                    'v2.0', 'routers', '{}.json'.format(router_id)])
+
+    def serve(self, keystone_manager, request):
+        with open(os.path.join(self.spool, 'request.json'), 'w') as spooled:
+            jsonutils.dump(request, spooled)
+        ospurge.serve(keystone_manager, self.args, once=True)
+        with open(os.path.join(self.spool, 'request.result')) as result:
+            return jsonutils.load(result)
+
+    @httpretty.activate
+    def test_serve(self):
+        self.stub_cloud()
+        keystone_manager = ospurge.KeystoneManager(
+            USERNAME, PASSWORD, 'demo', AUTH_URL, False)
+        self.assertEqual(0, self.serve(keystone_manager,
+                                       {'project': 'demo'})['exit_code'])
+        deleted = [req.path for req in httpretty.HTTPretty.latest_requests
+                   if req.method == 'DELETE' and 'routers' in req.path]
+        self.assertEqual(
+            sorted('/v2.0/routers/{}.json'.format(router_id)
+                   for router_id in client_fixtures.ROUTERS_IDS),
+            sorted(deleted))
+        # Projects created while serving can be purged
+        newcomer = {'id': 'f3c1e2b9a8d74c6b9e0d1a2b3c4d5e6f',
+                    'name': 'newcomer', 'enabled': True}
+        self.stub_tenants(client_fixtures.TENANTS_LIST['tenants'] + [newcomer])
+        self.stub_url('GET', parts=['tenants', 'newcomer'], status=404,
+                      json={'error': {'code': 404, 'title': 'Not Found',
+                                      'message': 'Not Found'}})
+        self.assertEqual(0, self.serve(keystone_manager,
+                                       {'project': 'newcomer',
+                                        'dry_run': True})['exit_code'])
+
+
+class WorklistTest(testtools.TestCase):
+
+    def setUp(self):
+        super(WorklistTest, self).setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'worklist.db')
+
+    def test_leases(self):
+        # Leases of worker1 expire right away
+        worker1 = ospurge.Worklist(self.path, 'worker1', lease_duration=-1)
+        worker2 = ospurge.Worklist(self.path, 'worker2')
+        worker1.add(['p1', 'p2'])
+        worker2.add(['p1'])
+        self.assertEqual('p1', worker1.lease())
+        # p1 is stolen from worker1
+        self.assertEqual('p1', worker2.lease())
+        self.assertEqual('p2', worker2.lease())
+        self.assertIsNone(worker2.lease())
+        self.assertFalse(worker1.renew('p1'))
+        self.assertTrue(worker2.renew('p1'))
+        worker1.complete('p1', 0)
+        worker2.complete('p2', 0)
+        self.assertIsNone(worker1.lease())
+        self.assertTrue(worker2.renew('p1'))
+
+    def patch_cleanup(self, purge):
+        """Patches ProjectCleanup, purging projects with purge(project)."""
+        self.torn_down = []
+        test = self
+
+        class FakeCleanup(object):
+            def __init__(self, keystone_manager, project, args, fresh,
+                         aborted):
+                self.project = project
+
+            def prepare(self):
+                return 0
+
+            def purge(self):
+                return purge(self.project)
+
+            def teardown(self):
+                test.torn_down.append(self.project)
+                return 0
+        self.patch(ospurge, 'ProjectCleanup', FakeCleanup)
+
+    def test_purge_worklist(self):
+        purged = []
+
+        def purge(project):
+            purged.append(project)
+            return ospurge.NOT_AUTHORIZED if project == 'p2' else 0
+        self.patch_cleanup(purge)
+        worklist = ospurge.Worklist(self.path)
+        worklist.add(['p1', 'p2', 'p3'])
+        code = ospurge.purge_worklist(None, worklist, None)
+        self.assertEqual(ospurge.NOT_AUTHORIZED, code)
+        self.assertEqual(['p1', 'p2', 'p3'], purged)
+        self.assertEqual(['p1', 'p3'], self.torn_down)
+        self.assertIsNone(worklist.lease())
+
+    def test_lease_lost(self):
+        worklist = ospurge.Worklist(self.path, 'worker1', lease_duration=-1)
+        worklist.add(['p1'])
+
+        def purge(project):
+            # The lease expired, and another process took it over
+            self.assertEqual('p1', ospurge.Worklist(self.path).lease())
+            return 0
+        self.patch_cleanup(purge)
+        self.patch(ospurge.sys, 'stdout', StringIO())
+        code = ospurge.purge_worklist(None, worklist, None)
+        self.assertEqual(ospurge.PurgeAborted.ERROR_CODE, code)
+        # The project isn't deleted
+        self.assertEqual([], self.torn_down)
+
+    def test_heartbeat_error(self):
+        worklist = ospurge.Worklist(self.path, lease_duration=0.03)
+        worklist.add(['p1'])
+        worklist.lease()
+
+        def renew(project):
+            raise ospurge.sqlite3.OperationalError('database is locked')
+        self.patch(worklist, 'renew', renew)
+        lost = threading.Event()
+        worklist.heartbeat('p1', threading.Event(), lost)
+        self.assertTrue(lost.is_set())
+
+
+class InventoryStoreTest(testtools.TestCase):
+
+    def setUp(self):
+        super(InventoryStoreTest, self).setUp()
+        self.store = ospurge.InventoryStore(os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'inventory.db'))
+        self.listed = []
+        self.deleted = []
+        self.since = []
+        test = self
+
+        class Volumes(ospurge.Resources):
+            RESOURCE_TYPE = 'volume'
+
+            def list(self):
+                test.since.append(self.since)
+                return (self.reference(res_id, res_id) for res_id in test.listed)
+
+            def delete(self, volume):
+                test.deleted.append(volume.id)
+        self.session = argparse.Namespace(
+            project_id=client_fixtures.PROJECT_ID, project_name='demo',
+            detailed=False, store=self.store, baseline=None, inventory=None,
+            progress=None,
+            incremental=False, reconcile_interval=3600, page_size=1)
+        self.volumes = Volumes(self.session)
+
+    def test_record(self):
+        self.assertEqual(0, self.store.last_run())
+        self.store.start_run()
+        self.listed = ['v1', 'v2']
+        self.assertEqual(['v1', 'v2'],
+                         [ref.id for ref in self.volumes.listing()])
+        self.assertEqual(1, self.store.last_run())
+        self.assertEqual(set([('', 'v1'), ('', 'v2')]),
+                         self.store.keys(1, 'demo', 'Volumes'))
+        stored = self.store.query(1, client_fixtures.PROJECT_ID)
+        self.assertEqual([(client_fixtures.PROJECT_ID, 'Volumes', 'volume',
+                           'v1')],
+                         [(project_id, rc, ref.type, ref.id)
+                          for project_id, rc, ref in stored[:1]])
+        self.assertEqual([], self.store.query(1, 'other'))
+
+    def test_diff(self):
+        self.store.start_run()
+        self.listed = ['v1', 'v2']
+        list(self.volumes.listing())
+        self.store.start_run()
+        self.session.baseline = 1
+        self.listed = ['v2', 'v3']
+        self.assertEqual(['* Resources type: Volumes',
+                          '  volume v2 (id v2)',
+                          '+ volume v3 (id v3)',
+                          '- volume v1 (id v1)',
+                          '* Since run 1: 1 new, 1 removed, 1 unchanged',
+                          ''],
+                         list(self.volumes.dump_lines()))
+
+    def test_purge_new_resources(self):
+        self.store.start_run()
+        self.listed = ['v1']
+        list(self.volumes.listing())
+        self.store.start_run()
+        self.session.baseline = 1
+        self.listed = ['v1', 'v2']
+        self.volumes.purge()
+        self.assertEqual(['v2'], self.deleted)
+
+    def test_record_interrupted(self):
+        self.store.start_run()
+        self.listed = ['v1', 'v2']
+        listing = self.volumes.listing()
+        next(listing)
+        listing.close()
+        # The recorded page is kept, but the listing isn't complete
+        self.assertEqual(set([('', 'v1')]),
+                         self.store.keys(1, 'demo', 'Volumes'))
+        self.assertFalse(self.store.listed(1, client_fixtures.PROJECT_ID,
+                                           'Volumes'))
+
+    def test_purge_empty_baseline(self):
+        self.store.start_run()
+        list(self.volumes.listing())
+        self.store.start_run()
+        self.session.baseline = 1
+        self.listed = ['v1']
+        self.volumes.purge()
+        self.assertEqual(['v1'], self.deleted)
+
+    def test_baseline_missing(self):
+        # e.g. a --summary run, or one restricted to other --resources
+        self.store.start_run()
+        self.store.start_run()
+        self.session.baseline = 1
+        self.listed = ['v1']
+        self.assertRaises(ospurge.BaselineMissing, self.volumes.purge)
+        self.assertRaises(ospurge.BaselineMissing, list,
+                          self.volumes.dump_lines())
+        self.assertEqual([], self.deleted)
+        # The resources class is skipped
+        self.assertIsNone(ospurge.perform_on_resources(
+            self.session, lambda session: self.volumes, 'purge'))
+        self.assertEqual([], self.deleted)
+
+    def test_incremental_purge(self):
+        self.session.incremental = True
+        self.patch(ospurge.time, 'time', lambda: 1415000000.0)
+        self.volumes.purge()
+        self.assertEqual((1415000000.0, 1415000000.0),
+                         self.store.last_sweep(client_fixtures.PROJECT_ID,
+                                               'Volumes'))
+        self.patch(ospurge.time, 'time', lambda: 1415001000.0)
+        self.volumes.purge()
+        # Listed since the last sweep, minus the clock skew margin
+        self.assertEqual([None, '2014-11-03T07:28:20'], self.since)
+        self.assertEqual((1415001000.0, 1415000000.0),
+                         self.store.last_sweep(client_fixtures.PROJECT_ID,
+                                               'Volumes'))
+        # All resources are listed again after the reconcile interval
+        self.patch(ospurge.time, 'time', lambda: 1415003600.0)
+        self.volumes.purge()
+        self.assertIsNone(self.since[-1])
+        self.assertEqual((1415003600.0, 1415003600.0),
+                         self.store.last_sweep(client_fixtures.PROJECT_ID,
+                                               'Volumes'))
+
+
+class RetryTest(testtools.TestCase):
+
+    def test_not_found(self):
+        calls = []
+
+        def delete():
+            calls.append(None)
+            raise novaclient.exceptions.NotFound(404)
+        self.patch(ospurge.time, 'sleep', self.fail)
+        self.assertIsNone(ospurge.retry('NovaServers')(delete)())
+        self.assertEqual(1, len(calls))
+
+    def test_deletion_failed(self):
+        def delete():
+            raise novaclient.exceptions.Conflict(409)
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        self.assertRaises(ospurge.DeletionFailed,
+                          ospurge.retry('NovaServers')(delete))
+
+    def test_not_found_before_delete(self):
+        calls = []
+
+        def step():
+            raise novaclient.exceptions.NotFound(404)
+
+        def delete():
+            ospurge.ignore_not_found(step)
+            calls.append(None)
+            raise novaclient.exceptions.Conflict(409)
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        # Only the final call can report the resource as deleted
+        self.assertRaises(ospurge.DeletionFailed,
+                          ospurge.retry('NovaServers')(delete))
+        self.assertEqual(ospurge.RETRIES + 1, len(calls))
+
+
+class ProgressTest(testtools.TestCase):
+
+    def setUp(self):
+        super(ProgressTest, self).setUp()
+        self.now = 1415000000.0
+        self.patch(ospurge.time, 'time', lambda: self.now)
+        self.out = StringIO()
+        self.progress = ospurge.Progress(self.out)
+
+    def test_report(self):
+        list(self.progress.counted('NovaServers', range(30)))
+        for _ in range(10):
+            self.progress.add('NovaServers', 'deleted')
+        self.now += 5
+        self.progress.report()
+        self.assertIn("* NovaServers: 30 listed, 10 deleted, 0 retrying, "
+                      "0 failed, 2.0 deletes/s, ETA 0:00:10",
+                      self.out.getvalue())
+        # Stalled purges are reported too
+        self.now += 10
+        self.progress.report()
+        self.assertIn("0.0 deletes/s, ETA -",
+                      self.out.getvalue().splitlines()[-1])
+
+    def test_listing_pending(self):
+        servers = self.progress.counted('NovaServers', range(30))
+        # Servers are deleted as they are listed
+        for _ in itertools.islice(servers, 10):
+            self.progress.add('NovaServers', 'deleted')
+        self.now += 5
+        self.progress.report()
+        self.assertIn("* NovaServers: 10 listed, 10 deleted, 0 retrying, "
+                      "0 failed, 2.0 deletes/s, ETA unknown",
+                      self.out.getvalue())
+
+    def test_retries(self):
+        attempts = []
+
+        def delete():
+            attempts.append(None)
+            if len(attempts) == 1:
+                self.assertEqual(
+                    0, self.progress.counts.get('NovaServers', {}).get(
+                        'retrying', 0))
+                raise novaclient.exceptions.Conflict(409)
+            self.assertEqual(1, self.progress.counts['NovaServers']['retrying'])
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        ospurge.retry('NovaServers', self.progress)(delete)()
+        self.assertEqual({'listed': 0, 'deleted': 0, 'retrying': 0,
+                          'failed': 0},
+                         self.progress.counts['NovaServers'])
+
+
+class ListConcurrentlyTest(testtools.TestCase):
+
+    def setUp(self):
+        super(ListConcurrentlyTest, self).setUp()
+        self.session = argparse.Namespace(
+            page_size=2, detailed=False, store=None, baseline=None,
+            inventory=None, incremental=False)
+
+        class Volumes(ospurge.Resources):
+            RESOURCE_TYPE = 'volume'
+
+            def list(self):
+                return (self.reference(res_id, res_id)
+                        for res_id in ('v1', 'v2', 'v3'))
+
+        class Images(ospurge.Resources):
+            RESOURCE_TYPE = 'image'
+
+            def list(self):
+                # Never ending listing
+                return (self.reference(str(n), 'image')
+                        for n in itertools.count())
+
+        class Broken(ospurge.Resources):
+
+            def list(self):
+                raise novaclient.exceptions.ClientException(500)
+        self.volumes, self.images, self.broken = Volumes, Images, Broken
+
+    def test_in_order(self):
+        out = StringIO()
+        self.patch(ospurge.sys, 'stdout', out)
+        self.assertIsNone(ospurge.list_concurrently(
+            self.session, [self.volumes, self.volumes], 'dump'))
+        lines = ['* Resources type: Volumes', 'volume v1 (id v1)',
+                 'volume v2 (id v2)', 'volume v3 (id v3)', '']
+        self.assertEqual(lines * 2, out.getvalue().splitlines())
+
+    def test_error(self):
+        self.patch(ospurge, 'TIMEOUT', 0.01)
+        # The listing of images is given up
+        self.assertRaises(novaclient.exceptions.ClientException,
+                          ospurge.list_concurrently, self.session,
+                          [self.broken, self.images], 'dump')
+
+
+class PaginateTest(testtools.TestCase):
+
+    def _list_page(self, resources, calls, ignore_marker=False):
+        def list_page(marker, limit):
+            calls.append(marker)
+            start = 0
+            if marker is not None and not ignore_marker:
+                start = resources.index(marker) + 1
+            if limit is None:
+                return resources[start:]
+            return resources[start:start + limit]
+        return list_page
+
+    def test_paginate(self):
+        calls = []
+        resources = range(7)
+        listed = ospurge.paginate(self._list_page(resources, calls), 3,
+                                  get_marker=lambda res: res)
+        self.assertEqual(resources, list(listed))
+        # Only an empty page ends the listing
+        self.assertEqual([None, 2, 5, 6], calls)
+
+    def test_pages_capped(self):
+        calls = []
+        list_page = self._list_page(range(5), calls)
+        # The API serves at most 2 resources per page
+        listed = ospurge.paginate(
+            lambda marker, limit: list_page(marker, min(limit, 2)), 3,
+            get_marker=lambda res: res)
+        self.assertEqual(range(5), list(listed))
+        self.assertEqual([None, 1, 3, 4], calls)
+
+    def test_next_page_fetched_before_last_resource(self):
+        calls = []
+        listed = ospurge.paginate(self._list_page(range(4), calls), 2,
+                                  get_marker=lambda res: res)
+        self.assertEqual([0], [next(listed)])
+        self.assertEqual([None], calls)
+        next(listed)
+        self.assertEqual([None, 1], calls)
+
+    def test_marker_ignored(self):
+        calls = []
+        listed = ospurge.paginate(
+            self._list_page(range(4), calls, ignore_marker=True), 2,
+            get_marker=lambda res: res)
+        # Resources are then listed at once
+        self.assertEqual([0, 1, 2, 3], list(listed))
+        self.assertEqual([None, 1, None], calls)
+
 # Abstract class
 
 
@@ -160,12 +953,139 @@ class TestSwiftObjects(TestSwiftBase):
     @httpretty.activate
     def test_list(self):
         self.stub_list()
-        objs = list(self.resources.list())
+        objs = [{'container': obj.parent, 'name': obj.name}
+                for obj in self.resources.list()]
         self.assertEqual(client_fixtures.STORAGE_OBJECTS, objs)
 
     def test_delete(self):
         self._test_delete()
 
+    def _purge(self):
+        self.stub_auth()
+        self.stub_list()
+        self.stub_delete()
+        for cont in client_fixtures.STORAGE_CONTAINERS:
+            self.stub_url('DELETE', parts=[cont])
+        self.resources.purge()
+        # Paths of deleted containers and objects, without /v1/AUTH_*/
+        return [req.path.split('/')[3:]
+                for req in httpretty.HTTPretty.latest_requests
+                if req.method == 'DELETE']
+
+    @httpretty.activate
+    def test_purge(self):
+        deleted = self._purge()
+        # Each container is deleted once its objects are
+        for cont in client_fixtures.STORAGE_CONTAINERS:
+            objs = [i for i, path in enumerate(deleted)
+                    if path[0] == cont and len(path) == 2]
+            self.assertTrue(max(objs) < deleted.index([cont]))
+        self.assertEqual(5, len(deleted))
+        # SwiftContainers doesn't list the deleted containers again
+        httpretty.reset()
+        self.assertEqual([], list(ospurge.SwiftContainers(self.session).list()))
+        self.assertEqual([], httpretty.HTTPretty.latest_requests)
+
+    @httpretty.activate
+    def test_purge_large_container(self):
+        self.stub_auth()
+        self.stub_url('GET', json=[{'name': 'large'}, {'name': 'small'}])
+        self.stub_url('GET', parts=['large'],
+                      json=[{'name': str(n)} for n in range(10)])
+        self.stub_url('GET', parts=['small'], json=[{'name': 'obj'}])
+        self.session.workers = 3
+        self.session.page_size = 2
+        small_deleted = threading.Event()
+        deleted = []
+        waits = []
+
+        def delete(obj):
+            if obj.parent == 'large':
+                waits.append(small_deleted.wait(5))
+            deleted.append((obj.parent, obj.name))
+
+        def delete_container(container):
+            deleted.append((container, None))
+            if container == 'small':
+                small_deleted.set()
+        self.patch(self.resources, 'delete', delete)
+        self.patch(self.resources, 'delete_container', delete_container)
+        self.resources.purge()
+        # The small container was deleted without waiting for the large one
+        self.assertEqual([True] * 10, waits)
+        self.assertEqual([('small', 'obj'), ('small', None)], deleted[:2])
+        self.assertEqual(('large', None), deleted[-1])
+        self.assertEqual(13, len(deleted))
+
+    @httpretty.activate
+    def test_purge_progress(self):
+        self.stub_url('HEAD',
+                      adding_headers=client_fixtures.STORAGE_ACCOUNT_HEADERS)
+        self.session.progress = ospurge.Progress(StringIO())
+        self._purge()
+        # The objects to delete are counted before any is listed
+        self.assertEqual({'listed': 3, 'deleted': 3, 'retrying': 0,
+                          'failed': 0},
+                         self.session.progress.counts['SwiftObjects'])
+        self.assertIn('SwiftObjects', self.session.progress.listings_done)
+
+    @httpretty.activate
+    def test_count(self):
+        self.stub_url('HEAD',
+                      adding_headers=client_fixtures.STORAGE_ACCOUNT_HEADERS)
+        self.assertEqual(3, self.resources.count())
+        self.assertEqual('HEAD', httpretty.last_request().method)
+
+    @httpretty.activate
+    def test_delete_slo(self):
+        self.stub_auth()
+        slo = client_fixtures.STORAGE_SLO
+        segments = client_fixtures.STORAGE_SLO_SEGMENTS
+        self.stub_url('GET', json=[{'name': slo['container']},
+                                   {'name': segments[0]['container']}])
+        self.stub_url('GET', parts=[slo['container']],
+                      json=client_fixtures.STORAGE_SLO_LIST)
+        self.stub_url('GET', parts=[slo['container'], slo['name']],
+                      json=client_fixtures.STORAGE_SLO_MANIFEST)
+        self.stub_url('GET', parts=[segments[0]['container']],
+                      json=[{'name': seg['name']} for seg in segments])
+        self.stub_url('DELETE', parts=[slo['container'], slo['name']])
+        for cont in (slo['container'], segments[0]['container']):
+            self.stub_url('DELETE', parts=[cont])
+        # Containers are purged in turn
+        self.session.workers = 1
+        self.resources.purge()
+        deletions = [req for req in httpretty.HTTPretty.latest_requests
+                     if req.method == 'DELETE']
+        self.assertEqual({'multipart-manifest': ['delete']},
+                         deletions[0].querystring)
+        # Segments were deleted along with their manifest
+        self.assertEqual([[slo['container']], [segments[0]['container']]],
+                         [req.path.split('/')[3:] for req in deletions[1:]])
+        self.assertEqual({}, self.resources.deleted_segments)
+
+    @httpretty.activate
+    def test_delete_slo_failed(self):
+        self.stub_auth()
+        slo = client_fixtures.STORAGE_SLO
+        self.stub_url('GET', parts=[slo['container'], slo['name']],
+                      json=client_fixtures.STORAGE_SLO_MANIFEST)
+        self.stub_url('DELETE', parts=[slo['container'], slo['name']],
+                      status=503)
+        manifest = self.resources.reference_object(
+            slo['container'], client_fixtures.STORAGE_SLO_LIST[0])
+        self.assertRaises(ospurge.swift_client.ClientException,
+                          self.resources.delete, manifest)
+        # Segments are still there, they will be deleted by the retry
+        self.assertEqual({}, self.resources.deleted_segments)
+
+    @httpretty.activate
+    def test_purge_objects_only(self):
+        self.session.resources = set(['SwiftObjects'])
+        deleted = self._purge()
+        self.assertEqual(3, len(deleted))
+        self.assertTrue(all(len(path) == 2 for path in deleted))
+
 
 class TestSwiftContainers(TestSwiftBase):
 
@@ -182,13 +1102,45 @@ class TestSwiftContainers(TestSwiftBase):
     @httpretty.activate
     def test_list(self):
         self.stub_list()
-        conts = list(self.resources.list())
+        conts = [cont.name for cont in self.resources.list()]
         self.assertEqual(conts, client_fixtures.STORAGE_CONTAINERS)
 
     def test_delete(self):
         self._test_delete()
 
 
+class TestPerformOnProject(TestSwiftBase):
+
+    @httpretty.activate
+    def test_dump_in_order(self):
+        self.stub_auth()
+        self.stub_url('GET', json=client_fixtures.STORAGE_CONTAINERS_LIST)
+        for cont in client_fixtures.STORAGE_CONTAINERS:
+            self.stub_url('GET', parts=[cont], json=[])
+        out = StringIO()
+        self.patch(ospurge.sys, 'stdout', out)
+        ospurge.perform_on_project(
+            USERNAME, PASSWORD, client_fixtures.PROJECT_ID, AUTH_URL,
+            action='dump', resources=set(['SwiftContainers', 'SwiftObjects']))
+        headers = [line for line in out.getvalue().splitlines()
+                   if line.startswith('* Resources type: ')]
+        self.assertEqual(['* Resources type: SwiftObjects',
+                          '* Resources type: SwiftContainers'], headers)
+
+    @httpretty.activate
+    def test_summary(self):
+        self.stub_auth()
+        self.stub_url('HEAD',
+                      adding_headers=client_fixtures.STORAGE_ACCOUNT_HEADERS)
+        out = StringIO()
+        self.patch(ospurge.sys, 'stdout', out)
+        ospurge.perform_on_project(
+            USERNAME, PASSWORD, client_fixtures.PROJECT_ID, AUTH_URL,
+            action='summary', resources=set(['SwiftContainers', 'SwiftObjects']))
+        self.assertEqual(['* SwiftObjects: 3 (40 bytes)', '* SwiftContainers: 2'],
+                         out.getvalue().splitlines())
+
+
 class TestCinderBase(TestResourcesBase):
     TEST_URL = client_fixtures.VOLUME_PUBLIC_ENDPOINT
 
@@ -197,7 +1149,7 @@ class TestCinderSnapshots(TestCinderBase):
     IDS = client_fixtures.SNAPSHOTS_IDS
 
     def stub_list(self):
-        self.stub_url('GET', parts=['snapshots', 'detail'],
+        self.stub_url('GET', parts=['snapshots'],
                       json=client_fixtures.SNAPSHOTS_LIST)
 
     def stub_delete(self):
@@ -214,12 +1166,20 @@ class TestCinderSnapshots(TestCinderBase):
     def test_delete(self):
         self._test_delete()
 
+    @httpretty.activate
+    def test_purge_cascaded(self):
+        self.session.catalog['volumev3'] = [
+            {'publicURL': client_fixtures.VOLUME_V3_PUBLIC_ENDPOINT}]
+        # Snapshots are neither listed nor deleted
+        self.resources.purge()
+        self.assertEqual([], httpretty.HTTPretty.latest_requests)
+
 
 class TestCinderVolumes(TestCinderBase):
     IDS = client_fixtures.VOLUMES_IDS
 
     def stub_list(self):
-        self.stub_url('GET', parts=['volumes', 'detail'],
+        self.stub_url('GET', parts=['volumes'],
                       json=client_fixtures.VOLUMES_LIST)
 
     def stub_delete(self):
@@ -236,6 +1196,55 @@ class TestCinderVolumes(TestCinderBase):
     def test_delete(self):
         self._test_delete()
 
+    @httpretty.activate
+    def test_delete_cascade(self):
+        self.stub_auth()
+        self.stub_url('DELETE', parts=['volumes', client_fixtures.VOLUMES_IDS[0]],
+                      base_url=client_fixtures.VOLUME_V3_PUBLIC_ENDPOINT,
+                      status=202)
+        self.session.catalog['volumev3'] = [
+            {'publicURL': client_fixtures.VOLUME_V3_PUBLIC_ENDPOINT}]
+        self.resources.delete(ospurge.ResourceRef(
+            'volume', client_fixtures.VOLUMES_IDS[0], 'vol'))
+        self.assertEqual(['true'],
+                         httpretty.last_request().querystring['cascade'])
+
+    @httpretty.activate
+    def test_purge_progress(self):
+        self.stub_auth()
+        self.stub_list()
+        self.stub_url('GET', parts=['limits'], json={'limits': {
+            'rate': [], 'absolute': {'totalVolumesUsed': len(self.IDS)}}})
+        self.session.progress = ospurge.Progress(StringIO())
+        listings_done = []
+
+        def delete(volume):
+            listings_done.append(
+                'CinderVolumes' in self.session.progress.listings_done)
+        self.patch(self.resources, 'delete', delete)
+        self.resources.purge()
+        # The volumes to delete are counted before the first deletion
+        self.assertEqual([True] * len(self.IDS), listings_done)
+        self.assertEqual({'listed': len(self.IDS), 'deleted': len(self.IDS),
+                          'retrying': 0, 'failed': 0},
+                         self.session.progress.counts['CinderVolumes'])
+        self.assertIn('/v1/{}/limits'.format(client_fixtures.PROJECT_ID),
+                      [req.path for req in httpretty.HTTPretty.latest_requests])
+
+    @httpretty.activate
+    def test_delete_snapshots_excluded(self):
+        self.stub_auth()
+        self.stub_delete()
+        self.session.catalog['volumev3'] = [
+            {'publicURL': client_fixtures.VOLUME_V3_PUBLIC_ENDPOINT}]
+        self.session.resources = set(['CinderVolumes'])
+        self.resources.delete(ospurge.ResourceRef(
+            'volume', client_fixtures.VOLUMES_IDS[0], 'vol'))
+        # Snapshots to keep aren't deleted along with their volume
+        self.assertEqual('DELETE', httpretty.last_request().method)
+        self.assertTrue(httpretty.last_request().path.startswith('/v1/'))
+        self.assertNotIn('cascade', httpretty.last_request().querystring)
+
 
 class TestNeutronBase(TestResourcesBase):
     TEST_URL = client_fixtures.NETWORK_PUBLIC_ENDPOINT
@@ -263,13 +1272,77 @@ class TestNeutronRouters(TestNeutronBase):
         super(TestNeutronRouters, self).setUp()
         self.resources = ospurge.NeutronRouters(self.session)
 
+    @httpretty.activate
+    def test_client_shared(self):
+        self.stub_auth()
+        self.stub_list_routers()
+        routers = ospurge.NeutronRouters(self.session)
+        ports = ospurge.NeutronPorts(self.session)
+        self.assertIs(routers.client, ports.client)
+        list(routers.list())
+        list(ospurge.NeutronRouters(self.session).list())
+        # The client authenticates once per session
+        tokens = [req for req in httpretty.HTTPretty.latest_requests
+                  if req.path.endswith('/tokens')]
+        self.assertEqual(1, len(tokens))
+
     def test_list(self):
         self._test_list()
 
+    @httpretty.activate
+    def test_delete_gateway_not_found(self):
+        self.stub_auth()
+        self.stub_delete()
+        routid = client_fixtures.ROUTERS_IDS[0]
+        self.stub_url('PUT', parts=['v2.0', 'routers', "%s.json" % routid],
+                      status=404)
+        self.resources.delete_resources(
+            [ospurge.ResourceRef('router', routid, '')])
+        # The router is deleted even though its gateway wasn't found
+        self.assertEqual('DELETE', httpretty.last_request().method)
+
+    @httpretty.activate
+    def test_list_from_inventory(self):
+        self.stub_auth()
+        self.stub_list()
+        self.session.inventory = ospurge.AdminInventory()
+        for _ in range(2):
+            ids = [router.id for router in self.resources.list()]
+            self.assertEqual(self.IDS, ids)
+        listings = [req for req in httpretty.HTTPretty.latest_requests
+                    if req.path.startswith('/v2.0/routers.json')]
+        # A single listing, of a page then of an empty one
+        self.assertEqual(2, len(listings))
+        index = self.session.inventory.indexes['NeutronRouters']
+        self.assertEqual(1, len(index['6b96ff0cb17a4b859e1e575d221683d3']))
+
     def test_delete(self):
         self._test_delete()
 
 
+class TestSweepOrphans(TestNeutronBase):
+
+    @httpretty.activate
+    def test_sweep_orphans(self):
+        self.stub_auth()
+        self.stub_list_routers()
+        routid = client_fixtures.ROUTERS_IDS[0]
+        self.stub_url('PUT', parts=['v2.0', 'routers', "%s.json" % routid],
+                      json=client_fixtures.ROUTER_CLEAR_GATEWAY)
+        self.stub_url('DELETE', parts=['v2.0', 'routers', "%s.json" % routid],
+                      json={})
+        ospurge.sweep_orphans(USERNAME, PASSWORD, client_fixtures.PROJECT_ID,
+                              AUTH_URL, lambda owner: owner != client_fixtures.PROJECT_ID,
+                              action='purge', resources=['NeutronRouters'])
+        deletions = [req for req in httpretty.HTTPretty.latest_requests
+                     if req.method == 'DELETE']
+        self.assertEqual(1, len(deletions))
+
+    def test_lists_all_tenants(self):
+        self.assertTrue(ospurge.NeutronRouters.LISTS_ALL_TENANTS)
+        self.assertFalse(ospurge.SwiftObjects.LISTS_ALL_TENANTS)
+
+
 class TestNeutronInterfaces(TestNeutronBase):
     IDS = client_fixtures.PORTS_IDS
 
@@ -282,6 +1355,9 @@ class TestNeutronInterfaces(TestNeutronBase):
 
     def stub_delete(self):
         for rout_id in client_fixtures.ROUTERS_IDS:
+            self.stub_url('PUT', parts=['v2.0', 'routers',
+                                        '{}.json'.format(rout_id)],
+                          json={'router': {'id': rout_id, 'routes': []}})
             self.stub_url('PUT', parts=['v2.0', 'routers', rout_id,
                                         'remove_router_interface.json'],
                           json=client_fixtures.REMOVE_ROUTER_INTERFACE)
@@ -296,6 +1372,33 @@ class TestNeutronInterfaces(TestNeutronBase):
     def test_delete(self):
         self._test_delete()
 
+    @httpretty.activate
+    def test_delete_resources(self):
+        self.stub_auth()
+        self.stub_delete()
+        routers = client_fixtures.ROUTERS_IDS
+        interfaces = [ospurge.ResourceRef('interface', port_id, '', router)
+                      for port_id, router in (('p1', routers[0]),
+                                              ('p2', routers[0]),
+                                              ('p3', routers[1]))]
+        budgets = []
+
+        def parallel(func, iterable, workers):
+            budgets.append(workers)
+            return [func(elt) for elt in iterable]
+        self.patch(ospurge, 'parallel', parallel)
+        self.resources.delete_resources(interfaces, 3)
+        paths = [req.path for req in httpretty.HTTPretty.latest_requests
+                 if req.method == 'PUT']
+        # Routes are purged once per router, before any interface removal
+        self.assertEqual(
+            ['/v2.0/routers/{}.json'.format(router) for router in routers],
+            paths[:2])
+        self.assertEqual(3, len([path for path in paths[2:] if path.endswith(
+            'remove_router_interface.json')]))
+        # Routers and interfaces are processed in turn, from 3 workers
+        self.assertEqual([3, 3], budgets)
+
 
 class TestNeutronPorts(TestNeutronBase):
     IDS = [client_fixtures.UNBOUND_PORT_ID]
@@ -319,6 +1422,81 @@ class TestNeutronPorts(TestNeutronBase):
     def test_delete(self):
         self._test_delete()
 
+    @httpretty.activate
+    def test_delete_cascaded(self):
+        self.stub_auth()
+        port_id = client_fixtures.UNBOUND_PORT_ID
+        self.stub_url('DELETE', parts=['v2.0', 'ports', "{}.json".format(port_id)],
+                      status=404)
+        self.patch(ospurge.time, 'sleep', self.fail)
+        # The port was deleted by Nova along with its server
+        self.resources.delete_resources(
+            [ospurge.ResourceRef('port', port_id, '')])
+
+    @httpretty.activate
+    def test_purge_progress(self):
+        self.stub_auth()
+        self.stub_list()
+        self.session.progress = ospurge.Progress(StringIO())
+        listings_done = []
+
+        def delete(port):
+            listings_done.append(
+                'NeutronPorts' in self.session.progress.listings_done)
+        self.patch(self.resources, 'delete', delete)
+        self.resources.purge()
+        # Ports are deleted serially, once they are all listed
+        self.assertEqual([True] * len(self.IDS), listings_done)
+        self.assertEqual(len(self.IDS),
+                         self.session.progress.counts['NeutronPorts']['listed'])
+
+    @httpretty.activate
+    def test_purge_from_inventory(self):
+        self.stub_auth()
+        ports = copy.deepcopy(client_fixtures.NEUTRON_PORTS)
+        server_ports = []
+        for n in range(3):
+            port = copy.deepcopy(ports['ports'][-2])
+            port.update(id='{}-{}'.format(client_fixtures.UNBOUND_PORT_ID, n),
+                        device_id=client_fixtures.SERVERS_IDS[0])
+            server_ports.append(port)
+        ports['ports'].extend(server_ports)
+        # Nova deleted the first two ports along with their server, and
+        # only unbound the last one, created beforehand
+        remaining = [{'id': port_id} for port_id in
+                     (client_fixtures.UNBOUND_PORT_ID, server_ports[2]['id'])]
+
+        def body(request, uri, headers):
+            if 'marker' in request.querystring:
+                return 200, headers, jsonutils.dumps({'ports': []})
+            if 'tenant_id' in request.querystring:
+                return 200, headers, jsonutils.dumps({'ports': remaining})
+            return 200, headers, jsonutils.dumps(ports)
+        self.stub_url('GET', parts=['v2.0', "ports.json"], body=body)
+        deleted = []
+
+        def delete(request, uri, headers):
+            deleted.append(uri.rsplit('/', 1)[-1][:-len('.json')])
+            return 204, headers, ''
+        port_ids = [client_fixtures.UNBOUND_PORT_ID]
+        port_ids.extend(server_port['id'] for server_port in server_ports)
+        for port_id in port_ids:
+            self.stub_url('DELETE',
+                          parts=['v2.0', 'ports', "{}.json".format(port_id)],
+                          body=delete)
+        self.session.inventory = ospurge.AdminInventory()
+        self.resources.purge()
+        # The DELETE calls of the ports gone are avoided
+        self.assertEqual(
+            [client_fixtures.UNBOUND_PORT_ID, server_ports[2]['id']], deleted)
+        # At the cost of a single listing of the project's port IDs
+        listings = [req.querystring for req in
+                    httpretty.HTTPretty.latest_requests
+                    if 'tenant_id' in req.querystring]
+        listings = [query for query in listings if 'marker' not in query]
+        self.assertEqual(1, len(listings))
+        self.assertEqual(['id'], listings[0]['fields'])
+
 
 class TestNeutronNetworks(TestNeutronBase):
     IDS = client_fixtures.NETWORKS_IDS
@@ -339,6 +1517,14 @@ class TestNeutronNetworks(TestNeutronBase):
     def test_list(self):
         self._test_list()
 
+    @httpretty.activate
+    def test_list_fields(self):
+        self.stub_auth()
+        self.stub_list()
+        list(self.resources.list())
+        self.assertEqual(['id', 'name', 'tenant_id'],
+                         httpretty.last_request().querystring['fields'])
+
     def test_delete(self):
         self._test_delete()
 
@@ -389,12 +1575,65 @@ class TestNeutronFloatingIps(TestNeutronBase):
         self._test_delete()
 
 
+class TestHeatStacks(TestResourcesBase):
+    TEST_URL = client_fixtures.ORCHESTRATION_PUBLIC_ENDPOINT
+    IDS = client_fixtures.STACKS_IDS
+
+    def stub_list(self):
+        self.stub_url('GET', parts=['stacks'],
+                      json=client_fixtures.STACKS_LIST)
+
+    def stub_delete(self):
+        self.stub_url('DELETE', parts=['stacks', client_fixtures.STACKS_IDS[0]],
+                      status=204)
+
+    def setUp(self):
+        super(TestHeatStacks, self).setUp()
+        self.resources = ospurge.HeatStacks(self.session)
+
+    def test_list(self):
+        self._test_list()
+
+    @httpretty.activate
+    def test_list_from_inventory(self):
+        self.stub_auth()
+        self.stub_list()
+        self.session.inventory = ospurge.AdminInventory()
+        ids = [stack.id for stack in self.resources.list()]
+        self.assertEqual(self.IDS, ids)
+        self.assertEqual(['True'], httpretty.last_request().querystring[
+            'global_tenant'])
+        index = self.session.inventory.indexes['HeatStacks']
+        self.assertEqual(1, len(index[client_fixtures.PROJECT_ID]))
+
+    def test_delete(self):
+        self._test_delete()
+
+    @httpretty.activate
+    def test_purge(self):
+        self.stub_auth()
+        self.stub_delete()
+        failed = copy.deepcopy(client_fixtures.STACKS_LIST)
+        failed['stacks'][0]['stack_status'] = 'DELETE_FAILED'
+        listings = [client_fixtures.STACKS_LIST, failed, {'stacks': []}]
+        self.stub_url('GET', parts=['stacks'], responses=[
+            httpretty.Response(body=jsonutils.dumps(listing),
+                               content_type='application/json')
+            for listing in listings])
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        self.resources.purge()
+        deletes = [req for req in httpretty.HTTPretty.latest_requests
+                   if req.method == 'DELETE']
+        # The stack is deleted again after its deletion failed
+        self.assertEqual(2, len(deletes))
+
+
 class TestNovaServers(TestResourcesBase):
     TEST_URL = client_fixtures.COMPUTE_PUBLIC_ENDPOINT
     IDS = client_fixtures.SERVERS_IDS
 
     def stub_list(self):
-        self.stub_url('GET', parts=['servers', 'detail'],
+        self.stub_url('GET', parts=['servers'],
                       json=client_fixtures.SERVERS_LIST)
 
     def stub_delete(self):
@@ -408,6 +1647,112 @@ class TestNovaServers(TestResourcesBase):
     def test_list(self):
         self._test_list()
 
+    @httpretty.activate
+    def test_list_detailed(self):
+        self.stub_auth()
+        self.stub_url('GET', parts=['servers', 'detail'],
+                      json=client_fixtures.SERVERS_LIST)
+        self.session.detailed = True
+        self.assertEqual(self.IDS, [s.id for s in self.resources.list()])
+        self.assertTrue(httpretty.last_request().path.startswith(
+            '/v2/43c9e28327094e1b81484f4b9aee74d5/servers/detail?'))
+
+    @httpretty.activate
+    def test_purge_force_delete(self):
+        self.stub_auth()
+        self.stub_list()
+        self.stub_delete()
+        self.stub_url('POST', parts=['servers', self.IDS[0], 'action'],
+                      status=202)
+        soft_deleted = copy.deepcopy(client_fixtures.SERVERS_LIST)
+        soft_deleted['servers'][0]['status'] = 'SOFT_DELETED'
+        self.stub_url('GET', parts=['servers', 'detail'], responses=[
+            httpretty.Response(body=jsonutils.dumps(listing),
+                               content_type='application/json')
+            for listing in (soft_deleted, {'servers': []})])
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        self.session.force_delete = True
+        self.resources.purge()
+        actions = [jsonutils.loads(req.body) for req in
+                   httpretty.HTTPretty.latest_requests
+                   if req.method == 'POST' and req.path.endswith('/action')]
+        self.assertEqual([{'forceDelete': None}], actions)
+
+    @httpretty.activate
+    def test_sweep_orphans(self):
+        self.stub_auth()
+        self.stub_delete()
+        self.stub_url('POST', parts=['servers', self.IDS[0], 'action'],
+                      status=202)
+        orphaned = copy.deepcopy(client_fixtures.SERVERS_LIST)
+        orphaned['servers'][0]['tenant_id'] = 'orphan'
+        soft_deleted = copy.deepcopy(orphaned)
+        soft_deleted['servers'][0]['status'] = 'SOFT_DELETED'
+        self.stub_url('GET', parts=['servers', 'detail'], responses=[
+            httpretty.Response(body=jsonutils.dumps(listing),
+                               content_type='application/json')
+            for listing in (orphaned, {'servers': []}, soft_deleted,
+                            {'servers': []})])
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        ospurge.sweep_orphans(USERNAME, PASSWORD, client_fixtures.PROJECT_ID,
+                              AUTH_URL, lambda owner: owner == 'orphan',
+                              action='purge', resources=['NovaServers'],
+                              force_delete=True)
+        listings = [req.querystring for req in
+                    httpretty.HTTPretty.latest_requests
+                    if req.path.split('?')[0].endswith('/servers/detail')]
+        # Orphaned servers are polled across all projects
+        self.assertEqual(5, len(listings))
+        self.assertTrue(all(query['all_tenants'] == ['1']
+                            for query in listings))
+        actions = [jsonutils.loads(req.body) for req in
+                   httpretty.HTTPretty.latest_requests
+                   if req.method == 'POST' and req.path.endswith('/action')]
+        self.assertEqual([{'forceDelete': None}], actions)
+
+    @httpretty.activate
+    def test_force_delete_failed(self):
+        self.stub_auth()
+        self.stub_url('POST', parts=['servers', self.IDS[0], 'action'],
+                      status=500)
+        soft_deleted = copy.deepcopy(client_fixtures.SERVERS_LIST)
+        soft_deleted['servers'][0]['status'] = 'SOFT_DELETED'
+        self.stub_url('GET', parts=['servers', 'detail'], json=soft_deleted)
+        self.patch(ospurge.time, 'sleep', lambda seconds: None)
+        self.session.force_delete = True
+        server = ospurge.ResourceRef('server', self.IDS[0], 'server')
+        self.assertRaises(ospurge.DeletionFailed, self.resources.wait_deleted,
+                          [server], self.resources.statuses,
+                          failed=('SOFT_DELETED',),
+                          delete=self.resources.force_delete)
+
+    @httpretty.activate
+    def test_list_since(self):
+        self.stub_auth()
+        servers = copy.deepcopy(client_fixtures.SERVERS_LIST)
+        deleted = dict(servers['servers'][0], id='deleted', status='DELETED')
+        servers['servers'].append(deleted)
+        self.stub_url('GET', parts=['servers', 'detail'], json=servers)
+        self.resources.since = '2014-11-03T07:28:20'
+        self.assertEqual(self.IDS, [s.id for s in self.resources.list()])
+        self.assertEqual(['2014-11-03T07:28:20Z'],
+                         httpretty.last_request().querystring['changes-since'])
+
+    @httpretty.activate
+    def test_count(self):
+        self.stub_auth()
+        self.stub_url('GET', parts=['limits'],
+                      json=client_fixtures.COMPUTE_LIMITS)
+        self.assertEqual(4, self.resources.count())
+
+    @httpretty.activate
+    def test_count_without_limit(self):
+        self.stub_auth()
+        self.stub_list()
+        self.stub_url('GET', parts=['limits'],
+                      json={'limits': {'rate': [], 'absolute': {}}})
+        self.assertEqual(len(self.IDS), self.resources.count())
+
     def test_delete(self):
         self._test_delete()
 
@@ -417,12 +1762,19 @@ class TestGlanceImages(TestResourcesBase):
     IDS = client_fixtures.IMAGES_IDS
 
     def stub_list(self):
-        self.stub_url('GET', parts=['v1', 'images', 'detail'],
+        self.stub_url('GET', parts=['v2', 'schemas', 'image'],
+                      json=client_fixtures.IMAGE_SCHEMA)
+        self.stub_url('GET', parts=['v2', 'images'],
                       json=client_fixtures.IMAGES_LIST)
 
     def stub_delete(self):
-        self.stub_url(
-            'DELETE', parts=['v1', 'images', client_fixtures.IMAGES_IDS[0]])
+        for image in client_fixtures.IMAGES_LIST['images']:
+            self.stub_url('GET', parts=['v2', 'images', image['id']],
+                          json=image)
+            self.stub_url('PATCH', parts=['v2', 'images', image['id']],
+                          json=image)
+            self.stub_url('DELETE', parts=['v2', 'images', image['id']],
+                          status=204)
 
     def setUp(self):
         super(TestGlanceImages, self).setUp()
@@ -434,6 +1786,33 @@ class TestGlanceImages(TestResourcesBase):
     def test_delete(self):
         self._test_delete()
 
+    @httpretty.activate
+    def test_list_error(self):
+        self.stub_auth()
+        self.stub_url('GET', parts=['v2', 'schemas', 'image'],
+                      json=client_fixtures.IMAGE_SCHEMA)
+        self.stub_url('GET', parts=['v2', 'images'], status=500)
+        self.assertRaises(glanceclient.exc.HTTPInternalServerError,
+                          self.resources.list)
+
+    @httpretty.activate
+    def test_purge(self):
+        self.stub_auth()
+        self.stub_list()
+        self.stub_delete()
+        self.resources.purge()
+        requests = [(req.method, req.path)
+                    for req in httpretty.HTTPretty.latest_requests
+                    if req.method in ('PATCH', 'DELETE')]
+        # Only the protected image is unprotected before its deletion
+        self.assertEqual(
+            [('PATCH', '/v2/images/{}'.format(self.IDS[0]))],
+            [req for req in requests if req[0] == 'PATCH'])
+        self.assertEqual(
+            sorted(('DELETE', '/v2/images/{}'.format(image_id))
+                   for image_id in self.IDS),
+            sorted(req for req in requests if req[0] == 'DELETE'))
+
 
 class TestCeilometerAlarms(TestResourcesBase):
     TEST_URL = client_fixtures.METERING_PUBLIC_ENDPOINT
@@ -455,7 +1834,7 @@ class TestCeilometerAlarms(TestResourcesBase):
         self.stub_auth()
         self.stub_list()
         elts = list(self.resources.list())
-        ids = [elt.alarm_id for elt in elts]
+        ids = [elt.id for elt in elts]
         self.assertEqual(client_fixtures.ALARMS_IDS, ids)
 
     def test_delete(self):